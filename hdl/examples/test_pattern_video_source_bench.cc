@@ -0,0 +1,97 @@
+// Copyright 2023 Oxide Computer Company
+//
+// This Source Code Form is subject to the terms of the Mozilla Public
+// License, v. 2.0. If a copy of the MPL was not distributed with this
+// file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+// Simulation throughput benchmark for the cxxrtl model of the test pattern
+// video source. The model is run for a number of frames, optionally writing a
+// VCD file, after which the number of simulated cycles, frames and the elapsed
+// wall clock time are printed as a METRIC line for `cobble cxxrtl_bench`:
+//
+//   METRIC <name> cycles=<n> frames=<n> elapsed_ns=<n>
+//
+// Usage: test_pattern_video_source_bench [--frames N] [--vcd PATH]
+
+#include "hdl/examples/test_pattern_video_source.h"
+
+#include <chrono>
+#include <cstdlib>
+#include <cstring>
+#include <fstream>
+#include <iostream>
+
+
+int main(int argc, char *argv[])
+{
+  auto frames = 100u;
+  const char *vcd_path = nullptr;
+
+  for (auto i = 1; i < argc; ++i)
+  {
+    if (std::strcmp(argv[i], "--frames") == 0 && i + 1 < argc)
+    {
+      frames = std::strtoul(argv[++i], nullptr, 10);
+    }
+    else if (std::strcmp(argv[i], "--vcd") == 0 && i + 1 < argc)
+    {
+      vcd_path = argv[++i];
+    }
+    else
+    {
+      std::cerr << "usage: " << argv[0] << " [--frames N] [--vcd PATH]" << std::endl;
+      return 1;
+    }
+  }
+
+  auto src = Source{};
+  auto vcd = std::ofstream{};
+
+  if (vcd_path != nullptr)
+  {
+    vcd.open(vcd_path);
+    src.init_debug(1, "us");
+  }
+
+  src.reset();
+  src.cycle();
+
+  // Skip the TMDS encoding pipeline fill, this is not representative of the
+  // steady state throughput of the model.
+  while (!src.ch_valid())
+  {
+    src.cycle();
+  }
+  src.write_debug_waves(vcd);
+
+  auto cycles = 0ul;
+  auto frames_seen = 0u;
+  auto v_sync = src.v_sync_ref();
+
+  auto start = std::chrono::steady_clock::now();
+
+  while (frames_seen < frames)
+  {
+    src.cycle();
+    src.write_debug_waves(vcd);
+    ++cycles;
+
+    // Count frames on the rising edge of the vertical sync.
+    if (src.v_sync_ref() && !v_sync)
+    {
+      ++frames_seen;
+    }
+    v_sync = src.v_sync_ref();
+  }
+
+  auto end = std::chrono::steady_clock::now();
+  auto elapsed = std::chrono::duration_cast<std::chrono::nanoseconds>(end - start);
+
+  std::cout << "METRIC test_pattern_video_source"
+            << (vcd_path != nullptr ? "_vcd" : "")
+            << " cycles=" << cycles
+            << " frames=" << frames_seen
+            << " elapsed_ns=" << elapsed.count()
+            << std::endl;
+  return 0;
+}
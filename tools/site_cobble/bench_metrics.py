@@ -0,0 +1,157 @@
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Collect and compare benchmark metrics.
+
+Benchmarks report their results by printing structured lines of the form
+
+    METRIC <name> <key>=<value> ...
+
+which are collected by name and compared against a baseline file holding the
+metrics of a previous run and optionally a regression threshold per metric:
+
+    {"thresholds": {<name>: <percent>}, "metrics": {<name>: {<key>: <value>}}}
+
+This is shared by the `bluesim_benchmark` and `cxxrtl_bench` commands.
+"""
+
+import argparse
+import json
+import os.path
+import re
+import sys
+
+
+_metric_re = re.compile(r'^METRIC\s+(\S+)((?:\s+\w+=\d+)*)\s*$')
+
+def parse_metrics(lines):
+    """Parse METRIC lines, returning a dict of metric name to a dict of its
+    values.
+    """
+    metrics = {}
+    for line in lines:
+        match = _metric_re.match(line)
+        if match:
+            metrics[match.group(1)] = {
+                k: int(v) for k, v in
+                (kv.split('=') for kv in match.group(2).split())
+            }
+    return metrics
+
+def load_baseline(path):
+    """Load the baseline from the given path, returning an empty baseline if no
+    path is given or the file does not exist yet.
+    """
+    if path is None or not os.path.exists(path):
+        return {'thresholds': {}, 'metrics': {}}
+
+    with open(path, 'r') as f:
+        baseline = json.load(f)
+    baseline.setdefault('thresholds', {})
+    baseline.setdefault('metrics', {})
+    return baseline
+
+def compare(metrics, baseline, key, default_threshold, higher_is_better = False):
+    """Compare the given key of each metric against the baseline.
+
+    A metric regresses if its value changes by more than its threshold (in
+    percent) in the wrong direction, or if it is in the baseline but was not
+    reported. Returns a list of `(name, previous, current, change, status)`
+    tuples, sorted by name, where `current` is the dict of values of the metric
+    and the other fields are None if not available, and the number of
+    regressions.
+    """
+    rows = []
+    regressions = 0
+
+    for name in sorted(set(metrics) | set(baseline['metrics'])):
+        current = metrics.get(name)
+        previous = baseline['metrics'].get(name, {}).get(key)
+        threshold = baseline['thresholds'].get(name, default_threshold)
+
+        change = None
+        status = ''
+        if current is None or key not in current:
+            status = 'MISSING'
+            regressions += 1
+        elif previous is None:
+            status = 'NEW'
+        else:
+            change = 100 * (current[key] - previous) / previous
+            if (-change if higher_is_better else change) > threshold:
+                status = f"REGRESSION (> {threshold}%)"
+                regressions += 1
+
+        rows.append((name, previous, current, change, status))
+
+    return rows, regressions
+
+def write_results(args, baseline, metrics):
+    """Write the metrics to the paths given by the `--json` and
+    `--update-baseline` arguments. Returns False if the baseline was to be
+    updated but no baseline path was given.
+    """
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(metrics, f, indent=4)
+
+    if args.update_baseline:
+        if args.baseline is None:
+            print('--update-baseline requires --baseline', file=sys.stderr)
+            return False
+
+        baseline['metrics'] = metrics
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+            f.write('\n')
+
+    return True
+
+def positive_int(s):
+    """Argument type accepting only integers greater than zero."""
+    value = int(s)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"{s} is not a positive number")
+    return value
+
+def add_arguments(parser, threshold_help, threshold_default):
+    """Add the build and baseline arguments shared by the benchmark commands to
+    the given parser.
+    """
+    parser.add_argument('-j', '--jobs',
+            help = 'run N build jobs in parallel',
+            type = int,
+            metavar = 'N',
+            dest = 'jobs')
+    parser.add_argument('-l', '--loadavg',
+            help = "don't start new build jobs if loadavg > N",
+            type = float,
+            metavar = 'N',
+            dest = 'loadavg')
+    parser.add_argument('-v', '--verbose',
+            help = 'verbose output: print output while building',
+            action = 'store_true',
+            dest = 'verbose')
+    parser.add_argument('--baseline',
+            help = 'JSON file holding the baseline metrics and any per metric '
+                'regression thresholds',
+            metavar = 'PATH',
+            dest = 'baseline')
+    parser.add_argument('--update-baseline',
+            help = 'write the current metrics to the baseline file',
+            action = 'store_true',
+            default = False,
+            dest = 'update_baseline')
+    parser.add_argument('--threshold',
+            help = threshold_help,
+            type = float,
+            default = threshold_default,
+            metavar = 'PCT',
+            dest = 'threshold')
+    parser.add_argument('--json',
+            help = 'write the collected metrics to PATH',
+            metavar = 'PATH',
+            dest = 'json')
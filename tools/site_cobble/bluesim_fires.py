@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Report rule utilization from a Bluesim VCD file.
+
+When built with -keep-fires (as done by the bluesim_debug environment), the
+CAN_FIRE_* and WILL_FIRE_* signals of each rule and method are present in the
+VCD written by a Bluesim test. This tool streams such a file, samples these
+signals once every clock cycle and reports for each module and rule how often
+it could fire and how often it actually fired. Rules which are ready but often
+do not fire are blocked by conflicts with other rules or methods and are
+flagged, as these usually limit the throughput of a design.
+
+Example, with the SPITests suite switched to the bluesim_debug environment:
+
+    ./cobble bluesim_test --vcd-always //hdl/interfaces:SPITests
+    ../tools/site_cobble/bluesim_fires.py vcd/SPITests_mkSpiDecodeTest.vcd
+"""
+
+import argparse
+import json
+import re
+import sys
+
+from vcd import VcdReader
+
+CAN_FIRE = 'CAN_FIRE_'
+WILL_FIRE = 'WILL_FIRE_'
+
+
+class RuleStats(object):
+    def __init__(self, scope, rule):
+        self.scope = scope
+        self.rule = rule
+        self.can_fire = 0
+        self.will_fire = 0
+        self.blocked = 0
+        # Current values of the CAN_FIRE/WILL_FIRE signals. If one of the two
+        # is missing from the dump, which happens if bsc merged them because
+        # the rule never conflicts, the other one is used in its place.
+        self.can_value = None
+        self.will_value = None
+
+    def sample(self):
+        can = self.can_value if self.can_value is not None else self.will_value
+        will = self.will_value if self.will_value is not None else can
+
+        if can == '1':
+            self.can_fire += 1
+            if will != '1':
+                self.blocked += 1
+        if will == '1':
+            self.will_fire += 1
+
+    @property
+    def name(self):
+        return '.'.join(self.scope + (self.rule,))
+
+    def blocked_ratio(self):
+        return self.blocked / self.can_fire if self.can_fire else 0.0
+
+    def to_dict(self, cycles):
+        return {
+            'module': '.'.join(self.scope),
+            'rule': self.rule,
+            'cycles': cycles,
+            'can_fire': self.can_fire,
+            'will_fire': self.will_fire,
+            'blocked': self.blocked,
+            'utilization': self.will_fire / cycles if cycles else 0.0,
+            'blocked_ratio': self.blocked_ratio(),
+        }
+
+
+def profile(f, clock_re):
+    """Stream the VCD in the given file, returning a tuple (cycles, rules)
+    where rules is a list of RuleStats.
+    """
+    reader = VcdReader(f)
+
+    rules = {}
+    # Map VCD id codes to the setters for the fire signals they represent.
+    fire_ids = {}
+    clock_ids = set()
+
+    for var in reader.vars:
+        if var.width != 1:
+            continue
+
+        for prefix, attr in ((CAN_FIRE, 'can_value'), (WILL_FIRE, 'will_value')):
+            if var.name.startswith(prefix):
+                rule = var.name[len(prefix):]
+                key = (var.scope, rule)
+                if key not in rules:
+                    rules[key] = RuleStats(var.scope, rule)
+                fire_ids.setdefault(var.id_code, []).append((rules[key], attr))
+
+        if clock_re.fullmatch(var.name):
+            clock_ids.add(var.id_code)
+
+    if not clock_ids:
+        raise ValueError('no clock signal matching '
+            f"'{clock_re.pattern}' found in VCD")
+
+    # Only the clock driving the first matching variable is used, all rules
+    # are sampled relative to it.
+    clock_id = sorted(clock_ids)[0]
+    clock_value = None
+    rising_edge = False
+    cycles = 0
+    time = None
+
+    def sample_all():
+        for stats in rules.values():
+            stats.sample()
+
+    for t, id_code, value in reader.changes():
+        # The fire signals of a cycle are written at the same time stamp as
+        # the clock edge which starts it, so sample once all changes for the
+        # time stamp of a rising edge have been applied.
+        if t != time:
+            if rising_edge:
+                sample_all()
+                cycles += 1
+                rising_edge = False
+            time = t
+
+        if id_code == clock_id:
+            rising_edge = rising_edge or (clock_value == '0' and value == '1')
+            clock_value = value
+
+        for stats, attr in fire_ids.get(id_code, ()):
+            setattr(stats, attr, value)
+
+    if rising_edge:
+        sample_all()
+        cycles += 1
+
+    return (cycles, sorted(rules.values(), key = lambda r: r.name))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description = 'Report rule utilization from a Bluesim VCD file')
+
+    parser.add_argument('vcd', metavar = 'PATH',
+            type = argparse.FileType('r'),
+            help = 'VCD file written by a Bluesim binary built with -keep-fires')
+    parser.add_argument('--clock', metavar = 'REGEX', default = 'CLK',
+            help = 'name of the clock signal used to sample the fire signals')
+    parser.add_argument('--module', metavar = 'REGEX', default = '.*',
+            help = 'only report rules in modules matching REGEX')
+    parser.add_argument('--blocked-threshold', metavar = 'RATIO',
+            type = float, default = 0.1,
+            help = 'flag rules which are blocked in more than RATIO of the '
+                'cycles they could fire')
+    parser.add_argument('--min-can-fire', metavar = 'N',
+            type = int, default = 1,
+            help = 'do not flag rules which could fire less than N times')
+    parser.add_argument('--json', metavar = 'PATH',
+            type = argparse.FileType('w'),
+            help = 'write the report as JSON to PATH')
+
+    args = parser.parse_args(args[1:])
+
+    try:
+        cycles, rules = profile(args.vcd, re.compile(args.clock))
+    except ValueError as e:
+        print(f"{args.vcd.name}: {e}", file = sys.stderr)
+        return 1
+
+    module_re = re.compile(args.module)
+    rules = [r for r in rules if module_re.search('.'.join(r.scope))]
+
+    def flagged(r):
+        return r.can_fire >= args.min_can_fire and \
+            r.blocked_ratio() > args.blocked_threshold
+
+    name_width = max([len(r.name) for r in rules] + [4])
+    print(f"{cycles} cycles")
+    print(f"{'Rule':<{name_width}}  {'CAN_FIRE':>10}  {'WILL_FIRE':>10}  "
+        f"{'Blocked':>10}  {'Util':>6}")
+    for r in rules:
+        utilization = 100 * r.will_fire / cycles if cycles else 0
+        print(f"{r.name:<{name_width}}  {r.can_fire:>10}  {r.will_fire:>10}  "
+            f"{r.blocked:>10}  {utilization:>5.1f}%"
+            + ('  BLOCKED' if flagged(r) else ''))
+
+    blocked = [r for r in rules if flagged(r)]
+    if blocked:
+        print()
+        print('Rules frequently blocked by conflicts:')
+        for r in sorted(blocked, key = lambda r: r.blocked_ratio(), reverse = True):
+            print(f"  {r.name}: blocked in {100 * r.blocked_ratio():.1f}% "
+                f"of {r.can_fire} cycles it could fire")
+
+    if args.json is not None:
+        json.dump({
+            'cycles': cycles,
+            'rules': [
+                dict(r.to_dict(cycles), flagged = flagged(r)) for r in rules
+            ],
+        }, args.json, indent = 4)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -6,12 +6,13 @@
 
 import argparse
 import curses
+import json
 import os.path
 import re
 import subprocess
 import sys
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
 from itertools import chain, groupby
 
@@ -20,6 +21,8 @@ import cobble.cmd
 from cobble.plugin import *
 from cobble.target import concrete_products, print_evaluation_error
 
+import bench_metrics
+
 
 # Define our Bluespec-specific environment keys and their behavior.
 BSC = cobble.env.overrideable_string_key('bsc')
@@ -54,6 +57,19 @@ _compile_keys = frozenset(['__order_only__', '__implicit__', BSC.name,
     BSC_FLAGS.name, BO_PATHS.name])
 _bluescan_keys = frozenset([BLUESCAN.name, BLUESCAN_FLAGS.name, BLUESCAN_MAP.name])
 
+# Environments a `bluesim_tests` suite opting in using `bench = True` is
+# additionally built under for benchmarking using `cobble bluesim_bench`,
+# besides its own. See BUILD.conf for their definitions.
+BLUESIM_BENCH_ENVS = [
+    'bluesim_fast',
+    'bluesim_fast_compile',
+]
+
+# The suite and environment of each binary benchmarked by `cobble
+# bluesim_bench`, by target (`//package:name`), recorded as the BUILD files are
+# evaluated.
+_bench_binaries = {}
+
 def _mapping(path):
     """Generates a 'ModName=path/to/ModName.bo' entry from a bo path."""
     return os.path.splitext(os.path.basename(path))[0] + '=' + path
@@ -350,8 +366,37 @@ def bluesim_binary(package, name, *,
         env,
         top,
         deps = [],
+        bench_suite = None,
         local: Delta = {},
         extra: Delta = {}):
+    # A binary given a `bench_suite`, as done by `bluesim_tests` for suites
+    # opting in to benchmarking, is also benchmarked by `cobble bluesim_bench`.
+    return _bluesim_binary(package, name,
+        env = env,
+        top = top,
+        deps = deps,
+        local = local,
+        extra = extra,
+        bench_suite = bench_suite)
+
+def _bluesim_binary(package, name, *,
+        env,
+        top,
+        deps = [],
+        local: Delta = {},
+        extra: Delta = {},
+        output_prefix = '',
+        bench_suite = None):
+    """Implementation factor for targets linking a Bluesim binary.
+
+    The script and shared object are exposed as '<output_prefix>script' and
+    '<output_prefix>so', allowing variants of a binary to be kept out of the
+    queries used by the test runner. Binaries given a `bench_suite` are
+    recorded for `cobble bluesim_bench`.
+    """
+    if bench_suite is not None:
+        _bench_binaries['//%s:%s' % (package.relpath, name)] = (bench_suite, env)
+
     def mkusing(ctx):
         # Resolve the module a Bluesim object file.
         top_path = ctx.rewrite_sources([top])[0]
@@ -397,8 +442,8 @@ def bluesim_binary(package, name, *,
             rule = 'link_bluesim_binary',
             order_only = stamp.outputs,
         )
-        simulation.expose(path = so_path, name = 'so')
-        simulation.expose(path = script_path, name = 'script')
+        simulation.expose(path = so_path, name = output_prefix + 'so')
+        simulation.expose(path = script_path, name = output_prefix + 'script')
         simulation.symlink(target = so_path, source = package.linkpath(so_name))
         simulation.symlink(
             target = script_path,
@@ -423,6 +468,7 @@ def bluesim_tests(name, *,
         suite,
         modules = [],
         deps = [],
+        bench = False,
         local: Delta = {},
         extra: Delta = {}):
     # Add a simulation target and bluesim_binary targets to the build graph.
@@ -440,9 +486,94 @@ def bluesim_tests(name, *,
             deps = [
                 ':' + name,
             ],
+            bench_suite = name if bench else None,
+            local = local,
+            extra = extra)
+
+        if not bench:
+            continue
+
+        # Add a variant of the binary for each of the other benchmark
+        # environments, allowing `cobble bluesim_bench` to compare build and
+        # run times of the suite between them and its own environment.
+        for bench_env in BLUESIM_BENCH_ENVS:
+            if bench_env == env:
+                continue
+
+            bluesim_bench_binary('{}_{}'.format(test_name, bench_env),
+                env = bench_env,
+                suite = name,
+                top = ':{}#{}'.format(name, test),
+                deps = [
+                    ':' + name,
+                ],
+                local = local,
+                extra = extra)
+
+@target_def
+def bluesim_bench_binary(package, name, *,
+        env,
+        suite,
+        top,
+        deps = [],
+        local: Delta = {},
+        extra: Delta = {}):
+    # Identical to a bluesim_binary, but exposed under a different name so
+    # these binaries are not picked up by `cobble bluesim_test`.
+    return _bluesim_binary(package, name,
+        env = env,
+        top = top,
+        deps = deps,
+        local = local,
+        extra = extra,
+        output_prefix = 'bench_',
+        bench_suite = suite)
+
+@target_def
+def bluesim_benchmark(package, name, *,
+        env,
+        top,
+        deps = [],
+        local: Delta = {},
+        extra: Delta = {}):
+    # A Bluesim binary which reports its results using METRIC lines, exposed
+    # under a different name so it can be found by `cobble bluesim_benchmark`.
+    return _bluesim_binary(package, name,
+        env = env,
+        top = top,
+        deps = deps,
+        local = local,
+        extra = extra,
+        output_prefix = 'benchmark_')
+
+@global_fn
+def bluesim_benchmarks(name, *,
+        env,
+        suite,
+        modules = [],
+        deps = [],
+        local: Delta = {},
+        extra: Delta = {}):
+    # Add a simulation target and bluesim_benchmark targets to the build graph.
+    bluespec_sim(name,
+        top = suite,
+        modules = modules,
+        deps = deps,
+        local = local)
+    for benchmark in modules:
+        bluesim_benchmark('{}_{}'.format(name, benchmark),
+            env = env,
+            top = ':{}#{}'.format(name, benchmark),
+            deps = [
+                ':' + name,
+            ],
             local = local,
             extra = extra)
 
+# Converter used to turn VCD files recorded by `bluesim_test` into trace
+# stores.
+VCD_TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vcd_trace.py')
+
 def _split_ident(s):
     """Split a given ident of the format package:target#output into those
     three parts.
@@ -509,14 +640,16 @@ def bluesim_test(subparsers):
             self._cursor_x = 0
             self._cursor_y = 0
 
-        def init_process(self, record_vcd):
-            """Set up the subprocess to execute the test."""
-            vcd_path = os.path.join(
+        @property
+        def vcd_path(self):
+            return os.path.join(
                 self.vcd_dir,
                 f"{os.path.basename(self.file_path)}.vcd")
 
+        def init_process(self, record_vcd):
+            """Set up the subprocess to execute the test."""
             cmd = [self.file_path]
-            if record_vcd: cmd += ['-V', vcd_path]
+            if record_vcd: cmd += ['-V', self.vcd_path]
 
             self.vcd_recorded = record_vcd
             self.previous_result = self.result
@@ -741,6 +874,17 @@ def bluesim_test(subparsers):
             # Render the final test result.
             test.print_status(is_tty=is_tty)
 
+            # Convert the VCD into a trace store if requested, so it can be
+            # queried without having to parse the VCD again.
+            if args.vcd_trace and test.vcd_recorded:
+                subprocess.run([
+                        sys.executable,
+                        VCD_TRACE,
+                        'convert',
+                        test.vcd_path,
+                    ],
+                    check=False)
+
             if (args.verbose or test.failed) and len(test.output) > 0:
                 for line in test.output:
                     print(' ', line, sep='')
@@ -820,6 +964,12 @@ def bluesim_test(subparsers):
             action = 'store_true',
             default = False,
             dest = 'vcd_always')
+    parser.add_argument('--vcd-trace',
+            help = 'convert recorded VCD files into trace stores which can be '
+                'queried using vcd_trace.py',
+            action = 'store_true',
+            default = False,
+            dest = 'vcd_trace')
     parser.add_argument('--no-ansi-tty',
             help = 'do not use ANSI TTY escape codes',
             action = 'store_true',
@@ -831,6 +981,277 @@ def bluesim_test(subparsers):
 
     return parser
 
+def _run_bluesim_script(path):
+    """Run a Bluesim binary to completion, returning a (passed, duration)
+    tuple. Pass/fail is determined similar to `bluesim_test`.
+    """
+    start = datetime.now()
+    proc = subprocess.run(
+        path,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        encoding='utf-8')
+    duration = datetime.now() - start
+
+    passed = proc.returncode == 0 and \
+        not any('assertion failed' in line for line in proc.stdout.splitlines())
+
+    return (passed, duration)
+
+@cmd
+def bluesim_bench(subparsers):
+    """The Bluesim benchmark builds the tests in each suite opting in to
+    benchmarking under its own and each of the benchmark environments and runs
+    them, reporting the time spent building, running and in total. This can be
+    used to determine which environment is best suited for a given suite in CI.
+    """
+
+    def cmd(project, args):
+        if not _bench_binaries:
+            print('No bluesim_tests suites opt in to benchmarking using '
+                'bench = True', file=sys.stderr)
+            return 1
+
+        # Only the binaries of suites opting in to benchmarking, in their own
+        # environment and the benchmark environments, match.
+        targets = '|'.join(re.escape(t) for t in sorted(_bench_binaries))
+        query_str = f"(?={args.query})({targets})#(bench_)?script$"
+
+        try:
+            # Build everything once in order to determine which benchmark
+            # binaries match the query.
+            results = cobble.cmd.query_products_and_build(
+                project,
+                re.compile(query_str),
+                jobs=getattr(args, 'jobs', None),
+                loadavg=getattr(args, 'loadavg', None),
+                verbose=args.verbose)
+
+            if len(results) == 0:
+                return 1
+        except cobble.target.EvaluationError as e:
+            cobble.target.print_evaluation_error(e)
+            return 1
+        except subprocess.CalledProcessError:
+            return 1
+
+        # Group the binaries by (package, suite) and environment.
+        benches = {}
+        for ident, output in results:
+            package, _, _ = _split_ident(ident)
+            suite, env = _bench_binaries[ident.split('#')[0]]
+
+            benches \
+                .setdefault((package, suite), {}) \
+                .setdefault(env, []) \
+                .append((ident, output.file_path))
+
+        rows = []
+        for (package, suite), envs in sorted(benches.items()):
+            for env, tests in sorted(envs.items()):
+                idents = [ident for ident, _ in tests]
+                paths = [path for _, path in tests]
+
+                # Remove the binaries and everything needed to build them, so
+                # the build time below reflects a build from scratch.
+                if not args.warm:
+                    subprocess.check_call(
+                        ['ninja', '-t', 'clean'] + paths,
+                        cwd=project.build_dir,
+                        stdout=subprocess.DEVNULL)
+
+                build_start = datetime.now()
+                try:
+                    cobble.cmd.query_products_and_build(
+                        project,
+                        re.compile('|'.join(re.escape(i) for i in idents)),
+                        jobs=getattr(args, 'jobs', None),
+                        loadavg=getattr(args, 'loadavg', None),
+                        verbose=args.verbose)
+                except subprocess.CalledProcessError:
+                    return 1
+                build_time = datetime.now() - build_start
+
+                run_time = timedelta()
+                failed = 0
+                for _ in range(args.runs):
+                    for path in paths:
+                        passed, duration = _run_bluesim_script(path)
+                        run_time += duration
+                        failed += 0 if passed else 1
+                run_time /= args.runs
+
+                rows.append({
+                    'package': package,
+                    'suite': suite,
+                    'env': env,
+                    'tests': len(paths),
+                    'failed': failed,
+                    'build_time': build_time.total_seconds(),
+                    'run_time': run_time.total_seconds(),
+                    'total_time': (build_time + run_time).total_seconds(),
+                })
+
+                r = rows[-1]
+                print(f"{package}:{suite}\t{env:<24}"
+                    f"build {r['build_time']:8.3f}s  "
+                    f"run {r['run_time']:8.3f}s  "
+                    f"total {r['total_time']:8.3f}s"
+                    + (f"  ({failed} FAILED)" if failed else ''))
+
+        # Recommend the environment with the lowest total time for each suite.
+        print()
+        print('Fastest environment per suite:')
+        for (package, suite), suite_rows in groupby(rows,
+                key = lambda r: (r['package'], r['suite'])):
+            best = min(suite_rows, key = lambda r: r['total_time'])
+            print(f"  {package}:{suite}\t{best['env']}")
+
+        if args.json is not None:
+            with open(args.json, 'w') as f:
+                json.dump(rows, f, indent=4)
+
+        return (0 if all(r['failed'] == 0 for r in rows) else 2)
+
+    parser = subparsers.add_parser('bluesim_bench',
+            help = 'benchmark Bluesim test suites across environments')
+    parser.add_argument('-j', '--jobs',
+            help = 'run N build jobs in parallel',
+            type = int,
+            metavar = 'N',
+            dest = 'jobs')
+    parser.add_argument('-l', '--loadavg',
+            help = "don't start new build jobs if loadavg > N",
+            type = float,
+            metavar = 'N',
+            dest = 'loadavg')
+    parser.add_argument('-v', '--verbose',
+            help = 'verbose output: print output while building',
+            action = 'store_true',
+            dest = 'verbose')
+    parser.add_argument('--runs',
+            help = 'run each test N times, reporting the average run time',
+            type = bench_metrics.positive_int,
+            default = 1,
+            metavar = 'N',
+            dest = 'runs')
+    parser.add_argument('--warm',
+            help = 'do not clean the binaries before timing their build',
+            action = 'store_true',
+            default = False,
+            dest = 'warm')
+    parser.add_argument('--json',
+            help = 'write the results to PATH',
+            metavar = 'PATH',
+            dest = 'json')
+    parser.add_argument('query',
+            help = 'Query of test suites to benchmark',
+            nargs = '?',
+            default = '.*Tests')
+    parser.set_defaults(go = cmd)
+
+    return parser
+
+
+@cmd
+def bluesim_benchmark_runner(subparsers):
+    """The Bluesim benchmark runner builds and runs bluesim_benchmark targets,
+    collects the METRIC lines printed by `BenchmarkCounter` in TestUtils.bsv
+    and compares the cycles per transaction against a stored baseline. Any
+    metric exceeding its baseline by more than the regression threshold fails
+    the run.
+    """
+
+    def cmd(project, args):
+        query_str = args.query
+        if not query_str.endswith('#benchmark_script'):
+            query_str += '.*#benchmark_script'
+
+        try:
+            results = cobble.cmd.query_products_and_build(
+                project,
+                re.compile(query_str),
+                jobs=getattr(args, 'jobs', None),
+                loadavg=getattr(args, 'loadavg', None),
+                verbose=args.verbose)
+
+            if len(results) == 0:
+                return 1
+        except cobble.target.EvaluationError as e:
+            cobble.target.print_evaluation_error(e)
+            return 1
+        except subprocess.CalledProcessError:
+            return 1
+
+        failed = False
+        metrics = {}
+        idents = {}
+        for ident, output in sorted(results, key = lambda r: r[0]):
+            proc = subprocess.run(
+                output.file_path,
+                shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                encoding='utf-8')
+            lines = proc.stdout.splitlines()
+
+            if proc.returncode != 0 or \
+                    any('assertion failed' in line for line in lines):
+                print(f"{ident} FAIL", file=sys.stderr)
+                for line in lines:
+                    print(' ', line, sep='', file=sys.stderr)
+                failed = True
+                continue
+
+            for name, values in bench_metrics.parse_metrics(lines).items():
+                if name in metrics:
+                    print(f"{ident}: duplicate metric {name}, also reported "
+                        f"by {idents[name]}", file=sys.stderr)
+                    failed = True
+                if 'cycles' in values and values.get('transactions', 0) > 0:
+                    values['cycles_per_transaction'] = \
+                        values['cycles'] / values['transactions']
+                metrics[name] = values
+                idents[name] = ident
+
+        baseline = bench_metrics.load_baseline(args.baseline)
+
+        # Compare against the baseline.
+        rows, regressions = bench_metrics.compare(
+            metrics,
+            baseline,
+            'cycles_per_transaction',
+            args.threshold)
+
+        def fmt(v): return f"{v:12.3f}" if v is not None else f"{'-':>12}"
+
+        print(f"{'Metric':<32} {'Baseline':>12} {'Current':>12} {'Change':>9}")
+        for name, previous, current, change, status in rows:
+            current = (current or {}).get('cycles_per_transaction')
+            change_str = f"{change:+8.2f}%" if change is not None else f"{'':>9}"
+            print(f"{name:<32} {fmt(previous)} {fmt(current)} {change_str} {status}")
+
+        if not bench_metrics.write_results(args, baseline, metrics):
+            return 1
+        if args.update_baseline:
+            return 0 if not failed else 2
+
+        return (0 if not failed and regressions == 0 else 2)
+
+    parser = subparsers.add_parser('bluesim_benchmark',
+            help = 'build and run Bluesim benchmarks, comparing against a baseline')
+    bench_metrics.add_arguments(parser,
+            threshold_help = 'default allowed increase in cycles per transaction, in percent',
+            threshold_default = 5.0)
+    parser.add_argument('query',
+            help = 'Query of benchmarks to build and run',
+            nargs = '?',
+            default = '.*Benchmarks')
+    parser.set_defaults(go = cmd)
+
+    return parser
+
 
 ninja_rules = {
     'compile_bluespec_obj': {
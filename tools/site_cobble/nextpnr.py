@@ -4,10 +4,24 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
 
+from itertools import chain, product
+
+import cobble.cmd
 import cobble.env
+import cobble.target
 from cobble.plugin import *
 
+import nextpnr_report
+
 
 CONSTRAINTS = cobble.env.overrideable_string_key('nextpnr_constraints',
         help = 'Path to contraints file for nextpnr.')
@@ -30,21 +44,47 @@ PACK_ICE40 = cobble.env.overrideable_string_key('nextpnr_ice40_pack',
 PACK_FLAGS_ICE40 = cobble.env.appending_string_seq_key('nextpnr_ice40_pack_flags',
         help = 'Extra flags to pass to ICE40 pack binary.')
 
+CLOCKS = cobble.env.overrideable_string_key('nextpnr_clocks',
+        help = 'Path to the script used to generate clock constraints from the netlist and '
+            'board constraints.')
+
+REPORT = cobble.env.overrideable_string_key('nextpnr_report',
+        help = 'Path to the script used to read nextpnr logs.')
+REPORT_FLAGS = cobble.env.appending_string_seq_key('nextpnr_report_flags',
+        help = 'Extra flags to pass to the report script, used for timing and utilization gates.')
+INCREMENTAL = cobble.env.overrideable_string_key('nextpnr_incremental',
+        help = 'Path to the script used to place and route designs incrementally.')
+
+ANNOTATE_FLAGS = cobble.env.appending_string_seq_key('nextpnr_annotate_flags',
+        help = 'Extra flags used when mapping critical paths back to the source of a design, such '
+            'as the directories holding its BSV sources.')
+
+CACHE = cobble.env.overrideable_string_key('nextpnr_cache',
+        help = 'Path to the netlist normalization and cache script.')
+CACHE_DIR = cobble.env.overrideable_string_key('nextpnr_cache_dir',
+        help = 'Directory holding the outputs of earlier place and route and pack runs.')
+
 KEYS = frozenset([
-    CONSTRAINTS,
+    CONSTRAINTS, CLOCKS, INCREMENTAL, REPORT, REPORT_FLAGS, ANNOTATE_FLAGS, CACHE, CACHE_DIR,
     NEXTPNR_ECP5, FLAGS_ECP5, PACK_ECP5, PACK_FLAGS_ECP5,
     NEXTPNR_ICE40, FLAGS_ICE40, PACK_ICE40, PACK_FLAGS_ICE40,
 ])
 
+_cache_keys = frozenset([CACHE.name, CACHE_DIR.name])
+_normalize_keys = frozenset([CACHE.name])
+_report_keys = frozenset([REPORT.name])
+_annotate_keys = frozenset([REPORT.name, ANNOTATE_FLAGS.name])
+_clocks_keys = frozenset([CLOCKS.name, CONSTRAINTS.name])
+
 _pnr_ecp5_keys = frozenset([
     NEXTPNR_ECP5.name, FLAGS_ECP5.name, CONSTRAINTS.name,
-])
-_pack_ecp5_keys = frozenset([PACK_ECP5.name, PACK_FLAGS_ECP5.name])
+]) | _cache_keys
+_pack_ecp5_keys = frozenset([PACK_ECP5.name, PACK_FLAGS_ECP5.name]) | _cache_keys
 
 _pnr_ice40_keys = frozenset([
     NEXTPNR_ICE40.name, FLAGS_ICE40.name, CONSTRAINTS.name,
-])
-_pack_ice40_keys = frozenset([PACK_ICE40.name, PACK_FLAGS_ICE40.name])
+]) | _cache_keys
+_pack_ice40_keys = frozenset([PACK_ICE40.name, PACK_FLAGS_ICE40.name]) | _cache_keys
 
 _known_families = frozenset(["ecp5", "ice40"])
 
@@ -53,45 +93,209 @@ def _any_bitstream(package, name, *,
         pnr_keys,
         pack_keys,
         flag_key,
+        pack_flag_key,
         env,
         design,
         pre_pack = [],
+        seeds = 1,
+        min_fmax = None,
+        max_utilization = None,
+        synthesis_log = False,
+        incremental = False,
+        compress = False,
+        spi_mode = None,
+        spi_frequency = None,
+        background = False,
         deps = [],
         local: Delta = {},
         extra: Delta = {}):
     if not nextpnr_family_name in _known_families:
-        raise AssertError("Unknown nextpnr family: " + nextpnr_family_name)
+        raise ValueError("Unknown nextpnr family: " + nextpnr_family_name)
+
+    # Options determining how the device loads the bitstream. icepack does not support any of
+    # these, an iCE40 reads its configuration at a fixed width and frequency.
+    pack_flags = []
+    if nextpnr_family_name == 'ecp5':
+        if compress:
+            pack_flags.append('--compress')
+        # Single is the read mode used when ecppack is not given one, and not accepted by it.
+        if spi_mode not in (None, 'single', 'fast-read', 'dual-spi', 'qspi'):
+            raise ValueError("Unknown SPI mode: " + spi_mode)
+        if spi_mode not in (None, 'single'):
+            pack_flags.append('--spimode ' + spi_mode)
+        if spi_frequency is not None:
+            pack_flags.append('--freq %s' % spi_frequency)
+        if background:
+            pack_flags.append('--background')
+    elif compress or spi_mode is not None or spi_frequency is not None or background:
+        raise ValueError("Bitstream options are not supported for " + nextpnr_family_name)
+
+    bitstream_report_flags = ['--family ' + nextpnr_family_name] + \
+        (['--compress'] if compress else []) + \
+        (['--spi-mode ' + spi_mode] if spi_mode is not None else []) + \
+        (['--spi-frequency %s' % spi_frequency] if spi_frequency is not None else [])
+
+    # When placing and routing incrementally, the placement of each run is kept next to its
+    # output and used to lock unchanged cells to their previous location in the next run. These
+    # runs are not cached, as restoring a cached result would leave that state, and with it the
+    # time saved reported by the next run, behind.
+    pnr_rule = 'place_and_route_' + nextpnr_family_name + '_design'
+    if incremental:
+        pnr_keys = pnr_keys | {INCREMENTAL.name}
+        pnr_rule += '_incremental'
+
+    report_flags = \
+        _threshold_flags('--min-fmax', min_fmax) + \
+        _threshold_flags('--max-utilization', max_utilization)
 
     def mkusing(ctx):
-        # Place and route design and produce a device configuration file in text format.
-        pps = ctx.rewrite_sources(pre_pack)
+        # Strip source locations and other non-functional details from the netlist, so changes
+        # which do not alter the logic do not cause the design to be placed and routed again.
+        design_path = ctx.rewrite_sources([design])[0]
+        normalize_env = ctx.env.subset_require(_normalize_keys)
+        netlist_path = package.outpath(normalize_env, name + '.json')
+        name_map_path = netlist_path + '.names.json'
+        # If the logic depth of the design is estimated, depend on the estimate so a design
+        # exceeding its limit fails before place and route.
+        netlist = cobble.target.Product(
+            env = normalize_env,
+            inputs = [design_path],
+            outputs = ([netlist_path], [name_map_path]),
+            implicit = [design_path + '.timing.json'] if 'yosys_timing' in ctx.env else [],
+            rule = 'normalize_netlist',
+        )
+
+        # Derive constraints for every clock in the design from the frequencies of the board
+        # clocks and the configuration of any PLLs, so place and route targets the actual
+        # frequency of each clock domain. Any pre-pack scripts given are run afterwards,
+        # allowing them to override these.
+        clocks_products = []
+        if CLOCKS.name in ctx.env:
+            clocks_env = ctx.env.subset_require(_clocks_keys)
+            clocks_path = package.outpath(clocks_env, name + '.clocks.py')
+            clocks = cobble.target.Product(
+                env = clocks_env,
+                inputs = netlist.outputs,
+                outputs = [clocks_path],
+                implicit = [ctx.env[CONSTRAINTS.name]],
+                rule = 'generate_nextpnr_clocks',
+            )
+            clocks.expose(path = clocks_path, name = 'clocks')
+            clocks_products.append(clocks)
+
+        # Place and route design and produce a device configuration file in text format. Unless
+        # placing and routing incrementally, the outputs of this step and the packing step below
+        # are cached, keyed on the content of the netlist, constraints, pre-pack scripts and flags.
+        pps = list(chain(*[c.outputs for c in clocks_products])) + ctx.rewrite_sources(pre_pack)
         config_env = ctx.env.subset_require(pnr_keys).derive({
             flag_key.name: ["--pre-pack " + s for s in pps],
         })
-        config_path = package.outpath(config_env, name + '.config')
-        log_path = config_path + '.log'
-        config = cobble.target.Product(
-            env = config_env,
-            inputs = ctx.rewrite_sources([design]),
-            outputs = ([config_path], [log_path]),
-            implicit = [ctx.env[CONSTRAINTS.name]] + pps,
-            rule = 'place_and_route_' + nextpnr_family_name + '_design',
-        )
+
+        def place_and_route(env, config_name):
+            config_path = package.outpath(env, config_name)
+            return cobble.target.Product(
+                env = env,
+                inputs = netlist.outputs,
+                outputs = ([config_path], [config_path + '.log']),
+                implicit = [ctx.env[CONSTRAINTS.name]] + pps,
+                rule = pnr_rule,
+            )
+
+        if seeds > 1:
+            # Place and route the design using different seeds, each as its own product so Ninja
+            # can run them in parallel, and select the run with the most timing margin.
+            seed_configs = [
+                place_and_route(
+                    config_env.derive({flag_key.name: ['--seed %d' % seed]}),
+                    '%s.seed%d.config' % (name, seed))
+                for seed in range(1, seeds + 1)
+            ]
+
+            select_env = ctx.env.subset_require(pnr_keys | _report_keys).derive({
+                flag_key.name: ["--pre-pack " + s for s in pps],
+            })
+            config_path = package.outpath(select_env, name + '.config')
+            summary_path = config_path + '.seeds.txt'
+            config = cobble.target.Product(
+                env = select_env,
+                inputs = [c.outputs[0] for c in seed_configs],
+                outputs = ([config_path], [config_path + '.log', summary_path]),
+                implicit = list(chain(*[c.implicit_outputs for c in seed_configs])),
+                rule = 'select_nextpnr_seed',
+            )
+            config.expose(path = summary_path, name = 'seeds')
+            config.symlink(
+                target = summary_path,
+                source = package.linkpath(name + '.seeds.txt'))
+            pnr_products = seed_configs + [config]
+        else:
+            config = place_and_route(config_env, name + '.config')
+            pnr_products = [config]
+
+        log_path = config.outputs[0] + '.log'
         config.expose(path = log_path, name = 'report')
         config_report_link = package.linkpath(name + '.report.txt')
         config.symlink(
             target = log_path,
             source = config_report_link)
 
+        # Map the critical paths in the log back to the Verilog and BSV source of the design,
+        # using the netlist as written by Yosys as it still carries the source locations. The
+        # names in the log are those of the normalized netlist, which are traced back to the
+        # original netlist through the name map written during normalization.
+        annotate_env = ctx.env.subset_require(_annotate_keys).derive({
+            ANNOTATE_FLAGS.name: [
+                '--netlist ' + design_path,
+                '--name-map ' + name_map_path,
+            ],
+        })
+        critical_path_out = name + '.critical_path.txt'
+        critical_path_path = package.outpath(annotate_env, critical_path_out)
+        critical_path = cobble.target.Product(
+            env = annotate_env,
+            inputs = [log_path],
+            outputs = ([critical_path_path], [critical_path_path + '.json']),
+            implicit = [design_path, name_map_path],
+            rule = 'nextpnr_annotate_critical_path',
+        )
+        critical_path.expose(path = critical_path_path, name = 'critical_path')
+        critical_path.symlink(
+            target = critical_path_path,
+            source = package.linkpath(critical_path_out))
+
+        # Extract timing and utilization from the log, failing the build if any of the given
+        # thresholds are not met. The annotated critical paths are produced first, so they are
+        # available when this fails. If requested, the Yosys log written alongside the design is
+        # read to include the runtime of synthesis in the report.
+        synthesis_log_path = design_path + '.log'
+        report_env = ctx.env.subset_require(_report_keys).derive({
+            REPORT_FLAGS.name: report_flags + (
+                ['--synthesis-log ' + synthesis_log_path] if synthesis_log else []),
+        })
+        report_path = package.outpath(report_env, name + '.report.json')
+        report = cobble.target.Product(
+            env = report_env,
+            inputs = [log_path],
+            outputs = [report_path],
+            implicit = critical_path.outputs + ([synthesis_log_path] if synthesis_log else []),
+            rule = 'nextpnr_timing_report',
+        )
+        report.expose(path = report_path, name = 'report_json')
+        report.symlink(
+            target = report_path,
+            source = package.linkpath(name + '.report.json'))
+
         # Pack device configuration file into a bitstream.
-        bitstream_env = ctx.env.subset_require(pack_keys)
+        bitstream_env = ctx.env.subset_require(pack_keys).derive({
+            pack_flag_key.name: pack_flags,
+        })
         bitstream_out = name + '.bit'
         bitstream_path = package.outpath(bitstream_env, bitstream_out)
         bitstream = cobble.target.Product(
             env = bitstream_env,
             inputs = config.outputs,
             outputs = [bitstream_path],
-            implicit = [config_report_link],
+            implicit = [config_report_link, report_path],
             rule = 'pack_' + nextpnr_family_name + '_bitstream',
         )
         bitstream.expose(path = bitstream_path, name = 'bitstream')
@@ -99,7 +303,26 @@ def _any_bitstream(package, name, *,
             target = bitstream_path,
             source = package.linkpath(bitstream_out))
 
-        return (extra, [config, bitstream])
+        # Report the size of the bitstream and an estimate of the time taken to load it.
+        bitstream_report_env = ctx.env.subset_require(_report_keys).derive({
+            REPORT_FLAGS.name: bitstream_report_flags + ['--config ' + config.outputs[0]],
+        })
+        bitstream_report_out = name + '.bitstream.txt'
+        bitstream_report_path = package.outpath(bitstream_report_env, bitstream_report_out)
+        bitstream_report = cobble.target.Product(
+            env = bitstream_report_env,
+            inputs = [bitstream_path],
+            outputs = ([bitstream_report_path], [bitstream_report_path + '.json']),
+            implicit = config.outputs,
+            rule = 'nextpnr_bitstream_report',
+        )
+        bitstream_report.expose(path = bitstream_report_path, name = 'bitstream_report')
+        bitstream_report.symlink(
+            target = bitstream_report_path,
+            source = package.linkpath(bitstream_report_out))
+
+        return (extra, [netlist] + clocks_products + pnr_products +
+            [critical_path, report, bitstream, bitstream_report])
 
     return cobble.target.Target(
         package = package,
@@ -112,12 +335,31 @@ def _any_bitstream(package, name, *,
         local = local,
     )
 
+def _threshold_flags(flag, threshold):
+    # Thresholds are either a single value applying to all clocks or resource classes, or a dict
+    # of clock name (matched as a substring) or resource to value.
+    if threshold is None:
+        return []
+    elif isinstance(threshold, dict):
+        return ['%s %s=%s' % (flag, k, v) for k, v in sorted(threshold.items())]
+    else:
+        return ['%s %s' % (flag, threshold)]
+
 @target_def
 def nextpnr_ecp5_bitstream(package, name, *,
         env,
         design,
         deps = [],
         pre_pack = [],
+        seeds = 1,
+        min_fmax = None,
+        max_utilization = None,
+        synthesis_log = False,
+        incremental = False,
+        compress = False,
+        spi_mode = None,
+        spi_frequency = None,
+        background = False,
         local: Delta = {},
         extra: Delta = {}):
     return _any_bitstream(package, name,
@@ -125,12 +367,22 @@ def nextpnr_ecp5_bitstream(package, name, *,
             design = design,
             deps = deps,
             pre_pack = pre_pack,
+            seeds = seeds,
+            min_fmax = min_fmax,
+            max_utilization = max_utilization,
+            synthesis_log = synthesis_log,
+            incremental = incremental,
+            compress = compress,
+            spi_mode = spi_mode,
+            spi_frequency = spi_frequency,
+            background = background,
             local = local,
             extra = extra,
             nextpnr_family_name = "ecp5",
             pnr_keys = _pnr_ecp5_keys,
             pack_keys = _pack_ecp5_keys,
             flag_key = FLAGS_ECP5,
+            pack_flag_key = PACK_FLAGS_ECP5,
     )
 
 @target_def
@@ -139,6 +391,15 @@ def nextpnr_ice40_bitstream(package, name, *,
         design,
         deps = [],
         pre_pack = [],
+        seeds = 1,
+        min_fmax = None,
+        max_utilization = None,
+        synthesis_log = False,
+        incremental = False,
+        compress = False,
+        spi_mode = None,
+        spi_frequency = None,
+        background = False,
         local: Delta = {},
         extra: Delta = {}):
     return _any_bitstream(package, name,
@@ -146,29 +407,436 @@ def nextpnr_ice40_bitstream(package, name, *,
             design = design,
             deps = deps,
             pre_pack = pre_pack,
+            seeds = seeds,
+            min_fmax = min_fmax,
+            max_utilization = max_utilization,
+            synthesis_log = synthesis_log,
+            incremental = incremental,
+            compress = compress,
+            spi_mode = spi_mode,
+            spi_frequency = spi_frequency,
+            background = background,
             local = local,
             extra = extra,
             nextpnr_family_name = "ice40",
             pnr_keys = _pnr_ice40_keys,
             pack_keys = _pack_ice40_keys,
             flag_key = FLAGS_ICE40,
+            pack_flag_key = PACK_FLAGS_ICE40,
     )
 
+# Outputs of the rules below are left untouched if their content did not change, allowing Ninja
+# to prune the remaining steps using restat.
+_cached_pnr = '$nextpnr_cache run --cache $nextpnr_cache_dir --output $out --output $out.log -- '
+_cached_pack = '$nextpnr_cache run --cache $nextpnr_cache_dir --output $out -- '
+_incremental_pnr = '$nextpnr_incremental --state $out.incremental -- '
+
+_pnr_ecp5 = '$nextpnr_ecp5 $nextpnr_ecp5_flags -l $out.log --lpf $nextpnr_constraints --json $in --textcfg $out'
+_pnr_ice40 = '$nextpnr_ice40 $nextpnr_ice40_flags -l $out.log --pcf $nextpnr_constraints --json $in --asc $out'
+
+# Synthesis strategies compared by default, as flags for the synthesis command of the family. Note
+# that `-dsp` is only useful for iCE40 UltraPlus devices and is therefore not included by default.
+ECP5_STRATEGIES = {
+    'default': [],
+    'abc9': ['-abc9'],
+    'abc2': ['-abc2'],
+    'nowidelut': ['-nowidelut'],
+    'abc9_nowidelut': ['-abc9', '-nowidelut'],
+}
+ICE40_STRATEGIES = {
+    'default': [],
+    'abc9': ['-abc9'],
+    'abc2': ['-abc2'],
+    'retime': ['-retime'],
+    'flowmap': ['-flowmap'],
+}
+
+def _strategy_sweep(bitstream, name, *,
+        env,
+        design,
+        strategies,
+        deps,
+        pre_pack,
+        extra):
+    # Add a bitstream target for each strategy, passing the strategy flags down to the Yosys
+    # design through its environment, and a report comparing them.
+    for strategy, flags in strategies.items():
+        bitstream('{}_{}'.format(name, strategy),
+            env = env,
+            design = design,
+            deps = deps,
+            pre_pack = pre_pack,
+            synthesis_log = True,
+            extra = dict(extra, yosys_synth_flags = flags))
+
+    nextpnr_sweep_report(name,
+        env = env,
+        reports = {
+            strategy: ':{}_{}#report_json'.format(name, strategy)
+            for strategy in strategies
+        },
+        deps = [
+            ':{}_{}'.format(name, strategy)
+            for strategy in strategies
+        ])
+
+@global_fn
+def nextpnr_ecp5_strategy_sweep(name, *,
+        env,
+        design,
+        strategies = ECP5_STRATEGIES,
+        deps = [],
+        pre_pack = [],
+        extra: Delta = {}):
+    _strategy_sweep(nextpnr_ecp5_bitstream, name,
+        env = env,
+        design = design,
+        strategies = strategies,
+        deps = deps,
+        pre_pack = pre_pack,
+        extra = extra)
+
+@global_fn
+def nextpnr_ice40_strategy_sweep(name, *,
+        env,
+        design,
+        strategies = ICE40_STRATEGIES,
+        deps = [],
+        pre_pack = [],
+        extra: Delta = {}):
+    _strategy_sweep(nextpnr_ice40_bitstream, name,
+        env = env,
+        design = design,
+        strategies = strategies,
+        deps = deps,
+        pre_pack = pre_pack,
+        extra = extra)
+
+@target_def
+def nextpnr_sweep_report(package, name, *,
+        env,
+        reports,
+        deps = [],
+        local: Delta = {}):
+    # Tabulate the timing, utilization and runtime of each strategy of a sweep.
+    def mkusing(ctx):
+        strategies = sorted(reports)
+        report_paths = ctx.rewrite_sources([reports[s] for s in strategies])
+
+        report_env = ctx.env.subset_require(_report_keys).derive({
+            REPORT_FLAGS.name: [
+                '%s=%s' % (s, path) for s, path in zip(strategies, report_paths)
+            ],
+        })
+        summary_out = name + '.sweep.txt'
+        summary_path = package.outpath(report_env, summary_out)
+        summary = cobble.target.Product(
+            env = report_env,
+            inputs = report_paths,
+            outputs = ([summary_path], [summary_path + '.json']),
+            rule = 'nextpnr_sweep_report',
+        )
+        summary.expose(path = summary_path, name = 'sweep')
+        summary.symlink(
+            target = summary_path,
+            source = package.linkpath(summary_out))
+
+        return ({}, [summary])
+
+    return cobble.target.Target(
+        package = package,
+        name = name,
+        concrete = True,
+        down = lambda _up_unused: package.project.find_environment(env),
+        using_and_products = mkusing,
+        deps = deps,
+        local = local,
+    )
+
+# Placer, router and threading options compared by `cobble nextpnr_bench`.
+BENCH_PLACERS = ['heap', 'sa']
+BENCH_ROUTERS = ['router1', 'router2']
+
+_wirelength_re = re.compile(r'wirelen(?:gth)?\s*[=:]\s*(\d+)', re.IGNORECASE)
+
+def _pnr_command(path):
+    """Return the nextpnr command Ninja uses to write the given place and route log, without the
+    cache wrapper and the options selecting the outputs, or None if not found.
+    """
+    command = subprocess.check_output(['ninja', '-t', 'commands', '-s', path],
+        encoding = 'utf-8').strip().splitlines()[-1]
+    args = shlex.split(command)
+
+    # Follow the selection of the best of a number of seeds to its first run.
+    if 'select' in args and '--summary' in args:
+        configs = args[args.index('--summary') + 2:]
+        return _pnr_command(configs[0] + '.log') if configs else None
+
+    # Strip the cache and incremental place and route wrappers.
+    while '--' in args:
+        args = args[args.index('--') + 1:]
+
+    command = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in ('-l', '--log', '--textcfg', '--asc', '--seed', '--threads', '--placer',
+                '--router'):
+            skip = True
+        elif arg not in ('--parallel-refine',):
+            command.append(arg)
+    return command if command and 'nextpnr' in os.path.basename(command[0]) else None
+
+def _run_pnr(command, options, outdir):
+    """Run the given nextpnr command with the given options, returning the wall time, peak memory
+    and log.
+    """
+    log_path = os.path.join(outdir, 'pnr.log')
+    output_flag = '--textcfg' if '--lpf' in command else '--asc'
+    argv = command + options + ['-l', log_path, output_flag, os.path.join(outdir, 'out')]
+
+    start = time.monotonic()
+    proc = subprocess.Popen(argv, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    seconds = time.monotonic() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    lines = []
+    if os.path.exists(log_path):
+        with open(log_path, 'r') as f:
+            lines = f.read().splitlines()
+
+    # ru_maxrss is reported in KiB on Linux.
+    return proc.returncode, seconds, rusage.ru_maxrss / 1024, lines
+
+@cmd
+def nextpnr_bench(subparsers):
+    """The nextpnr benchmark places and routes the designs of bitstream targets using each
+    combination of placer, router and threading options, recording the wall time, peak memory,
+    achieved frequencies and wirelength of each run. For each board it then recommends the options
+    which meet timing for all of its designs in the least time, or reach the largest timing margin
+    if none do, as flags to add to its environment in BUILD.conf.
+    """
+
+    def cmd(project, args):
+        query_str = args.query
+        if not query_str.endswith('#report'):
+            query_str += '.*#report'
+
+        try:
+            results = cobble.cmd.query_products_and_build(
+                project,
+                re.compile(query_str + '$'),
+                jobs = getattr(args, 'jobs', None),
+                loadavg = getattr(args, 'loadavg', None),
+                verbose = args.verbose)
+
+            if len(results) == 0:
+                return 1
+        except cobble.target.EvaluationError as e:
+            cobble.target.print_evaluation_error(e)
+            return 1
+        except subprocess.CalledProcessError:
+            return 1
+
+        threads = args.threads or os.cpu_count() or 1
+        # Parallel refinement is only supported by the HeAP placer.
+        matrix = [
+            ('--placer %s --router %s' % (placer, router)) + (
+                ' --threads %d' % threads +
+                    (' --parallel-refine' if placer == 'heap' else '')
+                if threaded else '')
+            for placer, router, threaded in product(
+                args.placer or BENCH_PLACERS,
+                args.router or BENCH_ROUTERS,
+                [False, True])
+        ]
+
+        # Run each design under each combination of options, grouping the results by board. The
+        # board is named after the directory holding its constraints file.
+        failed = False
+        runs = {}
+        for ident, output in sorted(results, key = lambda r: r[0]):
+            command = _pnr_command(output.file_path)
+            if command is None:
+                print(f"{ident}: unable to determine the nextpnr command", file = sys.stderr)
+                failed = True
+                continue
+
+            constraints = next((command[i + 1] for i, arg in enumerate(command[:-1])
+                if arg in ('--lpf', '--pcf')), '')
+            board = os.path.basename(os.path.dirname(constraints)) or 'default'
+            flags_key = 'nextpnr_ecp5_flags' if '--lpf' in command else 'nextpnr_ice40_flags'
+            target = ident.split('#')[0]
+
+            for options in matrix:
+                with tempfile.TemporaryDirectory() as outdir:
+                    returncode, seconds, peak_mib, lines = \
+                        _run_pnr(command, options.split(), outdir)
+
+                clocks = nextpnr_report.parse_clocks(lines)
+                wirelengths = [int(m.group(1)) for l in lines for m in _wirelength_re.finditer(l)]
+                result = {
+                    'returncode': returncode,
+                    'seconds': round(seconds, 3),
+                    'peak_mib': round(peak_mib, 1),
+                    'clocks': clocks,
+                    'margin': nextpnr_report.timing_margin(clocks),
+                    'wirelength': wirelengths[-1] if wirelengths else None,
+                }
+                runs.setdefault((board, flags_key), {}) \
+                    .setdefault(options, {})[target] = result
+
+                if returncode != 0:
+                    failed = True
+                margin = f"{result['margin']:.3f}" if result['margin'] is not None else '-'
+                print(f"{target:<48.48} {options:<56} {seconds:>8.1f}s "
+                    f"{peak_mib:>8.0f} MiB margin {margin}")
+
+        # Recommend the options with which all designs of a board complete and meet timing in the
+        # least total time. If no such options exist, recommend those with the best worst case
+        # timing margin.
+        recommendations = {}
+        for (board, flags_key), by_options in sorted(runs.items()):
+            def score(item):
+                _, designs = item
+                completed = all(r['returncode'] == 0 for r in designs.values())
+                margins = [r['margin'] for r in designs.values() if r['margin'] is not None]
+                worst = min(margins) if margins else 0
+                total = sum(r['seconds'] for r in designs.values())
+                return (completed, worst >= 1.0, worst if worst < 1.0 else 0, -total)
+
+            options, designs = max(by_options.items(), key = score)
+            recommendations[board] = {
+                'key': flags_key,
+                'flags': options.replace(' --', '\n--').split('\n'),
+                'seconds': sum(r['seconds'] for r in designs.values()),
+            }
+
+        print()
+        print('Recommended environment overrides for BUILD.conf:')
+        for board, r in recommendations.items():
+            print(f"    # {board}, {r['seconds']:.1f}s for all designs")
+            print(f"    '{r['key']}': [")
+            for flag in r['flags']:
+                print(f"        '{flag}',")
+            print('    ],')
+
+        if args.json is not None:
+            with open(args.json, 'w') as f:
+                json.dump({
+                    'runs': {
+                        board: by_options
+                        for (board, _), by_options in runs.items()
+                    },
+                    'recommendations': recommendations,
+                }, f, indent = 4, sort_keys = True)
+
+        return 0 if not failed else 2
+
+    parser = subparsers.add_parser('nextpnr_bench',
+            help = 'compare nextpnr placer, router and threading options per board')
+    parser.add_argument('-j', '--jobs',
+            help = 'run N build jobs in parallel',
+            type = int,
+            metavar = 'N',
+            dest = 'jobs')
+    parser.add_argument('-l', '--loadavg',
+            help = "don't start new build jobs if loadavg > N",
+            type = float,
+            metavar = 'N',
+            dest = 'loadavg')
+    parser.add_argument('-v', '--verbose',
+            help = 'verbose output: print output while building',
+            action = 'store_true',
+            dest = 'verbose')
+    parser.add_argument('--placer',
+            help = 'placer to compare, may be repeated (default: %s)' % ', '.join(BENCH_PLACERS),
+            action = 'append',
+            metavar = 'NAME',
+            dest = 'placer')
+    parser.add_argument('--router',
+            help = 'router to compare, may be repeated (default: %s)' % ', '.join(BENCH_ROUTERS),
+            action = 'append',
+            metavar = 'NAME',
+            dest = 'router')
+    parser.add_argument('--threads',
+            help = 'number of threads used by the threaded runs (default: number of CPUs)',
+            type = int,
+            metavar = 'N',
+            dest = 'threads')
+    parser.add_argument('--json',
+            help = 'write all runs and the recommendations to PATH',
+            metavar = 'PATH',
+            dest = 'json')
+    parser.add_argument('query',
+            help = 'Query of bitstream targets to benchmark',
+            nargs = '?',
+            default = '.*')
+    parser.set_defaults(go = cmd)
+
+    return parser
+
 ninja_rules = {
+    'normalize_netlist': {
+        'command': '$nextpnr_cache normalize --name-map $out.names.json $in $out',
+        'description': 'NORMALIZE $in',
+        'restat': '1',
+    },
     'place_and_route_ecp5_design': {
-        'command': '$nextpnr_ecp5 $nextpnr_ecp5_flags -l $out.log --lpf $nextpnr_constraints --json $in --textcfg $out',
+        'command': _cached_pnr + _pnr_ecp5,
         'description': 'PNR(ECP5) $in',
+        'restat': '1',
+    },
+    'place_and_route_ecp5_design_incremental': {
+        'command': _incremental_pnr + _pnr_ecp5,
+        'description': 'PNR(ECP5) $in',
+        'restat': '1',
+    },
+    'nextpnr_timing_report': {
+        'command': '$nextpnr_report report $nextpnr_report_flags --json $out $in',
+        'description': 'REPORT $in',
+    },
+    'nextpnr_annotate_critical_path': {
+        'command': '$nextpnr_report annotate $nextpnr_annotate_flags --output $out --json $out.json $in',
+        'description': 'ANNOTATE $out',
+    },
+    'nextpnr_sweep_report': {
+        'command': '$nextpnr_report sweep --output $out --json $out.json $nextpnr_report_flags',
+        'description': 'SWEEP $out',
+    },
+    'generate_nextpnr_clocks': {
+        'command': '$nextpnr_clocks --constraints $nextpnr_constraints --output $out $in',
+        'description': 'CLOCKS $out',
+        'restat': '1',
+    },
+    'nextpnr_bitstream_report': {
+        'command': '$nextpnr_report bitstream $nextpnr_report_flags --output $out --json $out.json $in',
+        'description': 'REPORT $in',
+    },
+    'select_nextpnr_seed': {
+        'command': '$nextpnr_report select --config $out --summary $out.seeds.txt $in',
+        'description': 'SELECT $out',
     },
     'pack_ecp5_bitstream': {
-        'command': '$nextpnr_ecp5_pack $in $out $nextpnr_ecp5_pack_flags',
+        'command': _cached_pack + '$nextpnr_ecp5_pack $in $out $nextpnr_ecp5_pack_flags',
         'description': 'PACK(ECP5) $in',
+        'restat': '1',
     },
     'place_and_route_ice40_design': {
-        'command': '$nextpnr_ice40 $nextpnr_ice40_flags -l $out.log --pcf $nextpnr_constraints --json $in --asc $out',
+        'command': _cached_pnr + _pnr_ice40,
+        'description': 'PNR(iCE40) $in',
+        'restat': '1',
+    },
+    'place_and_route_ice40_design_incremental': {
+        'command': _incremental_pnr + _pnr_ice40,
         'description': 'PNR(iCE40) $in',
+        'restat': '1',
     },
     'pack_ice40_bitstream': {
-        'command': '$nextpnr_ice40_pack $in $out $nextpnr_ice40_pack_flags',
+        'command': _cached_pack + '$nextpnr_ice40_pack $in $out $nextpnr_ice40_pack_flags',
         'description': 'PACK(iCE40) $in',
+        'restat': '1',
     },
 }
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Netlist normalization and a content addressed cache for nextpnr.
+
+Yosys JSON netlists carry `src` attributes and auto-generated names which
+include file names and line numbers. Adding a comment to a BSV file therefore
+changes the netlist even if the logic is identical, causing a full place and
+route. The `normalize` command removes these non-functional details and writes
+the netlist with cells, nets and bits in a deterministic order. The output is
+only written if its content changed, so Ninja (using `restat`) can prune the
+steps downstream of it. Optionally the renamed cells and nets are written to a
+name map, allowing names reported by nextpnr to be traced back to the original
+netlist.
+
+The `run` command runs a command, such as nextpnr or a bitstream packer, keyed
+on the command line, the version and binary of the tool and the content of
+every existing file named on it. If an earlier run with the same key is found
+in the cache directory, its outputs are restored instead, again only touching
+outputs whose content differs. Entries not used for `--max-age` days are
+removed, as are the least recently used entries once the cache grows beyond
+`--max-size` MiB.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from itertools import chain
+
+# Source locations embedded in names generated by Yosys, e.g.
+# `$and$mkTop.v:123$45` or `$procdff$mkTop.v:10.3-12.6$7`.
+_src_location_re = re.compile(r'\$[^$]*\.s?v:\d+(?:\.\d+-\d+\.\d+)?(?=\$)')
+
+# Attributes which carry no meaning for place and route.
+_nonfunctional_attributes = frozenset(['src'])
+
+
+def _strip_attributes(obj):
+    if 'attributes' in obj:
+        obj['attributes'] = {
+            k: v for k, v in obj['attributes'].items()
+            if k not in _nonfunctional_attributes
+        }
+
+
+def _canonical_names(names):
+    """Map the given names to names with source locations removed, keeping
+    the original name of any which would collide after doing so.
+    """
+    stripped = {}
+    for name in names:
+        stripped.setdefault(_src_location_re.sub('$', name), []).append(name)
+
+    mapping = {}
+    for new, old in stripped.items():
+        if old == [new] or (len(old) == 1 and new not in names):
+            mapping[old[0]] = new
+        else:
+            for name in old:
+                mapping[name] = name
+    return mapping
+
+
+def normalize_module(module):
+    """Normalize the given module in place, returning a dict of the original
+    to the new name of each cell and net which was renamed.
+    """
+    _strip_attributes(module)
+
+    cells = module.get('cells', {})
+    cell_names = _canonical_names(set(cells))
+    cells = {cell_names[name]: cell for name, cell in cells.items()}
+
+    netnames = module.get('netnames', {})
+    net_names = _canonical_names(set(netnames))
+    netnames = {net_names[name]: net for name, net in netnames.items()}
+
+    # Renumber bits in order of first use, walking ports, cells and nets by
+    # name. Bits are module local, constants are strings and kept as is.
+    bits = {}
+
+    def renumber(bs):
+        out = []
+        for b in bs:
+            if isinstance(b, int):
+                b = bits.setdefault(b, len(bits) + 2)
+            out.append(b)
+        return out
+
+    ports = module.get('ports', {})
+    for name in sorted(ports):
+        ports[name]['bits'] = renumber(ports[name]['bits'])
+
+    for name in sorted(cells):
+        cell = cells[name]
+        _strip_attributes(cell)
+        connections = cell.get('connections', {})
+        for port in sorted(connections):
+            connections[port] = renumber(connections[port])
+
+    for name in sorted(netnames):
+        net = netnames[name]
+        _strip_attributes(net)
+        net['bits'] = renumber(net['bits'])
+
+    if 'cells' in module:
+        module['cells'] = cells
+    if 'netnames' in module:
+        module['netnames'] = netnames
+
+    return {
+        old: new
+        for old, new in chain(cell_names.items(), net_names.items())
+        if old != new
+    }
+
+
+def normalize(netlist):
+    """Normalize the given netlist in place, returning a dict of module name
+    to the names renamed in that module.
+    """
+    # The creator string includes the Yosys version and build, which does not
+    # change the netlist itself. A different Yosys is still likely to produce
+    # a different netlist, changing the key anyway.
+    netlist.pop('creator', None)
+    return {
+        name: normalize_module(module)
+        for name, module in netlist.get('modules', {}).items()
+    }
+
+
+def _write_if_changed(path, content):
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            if f.read() == content:
+                return
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _normalize_cmd(args):
+    with open(args.input, 'r') as f:
+        netlist = json.load(f)
+    names = normalize(netlist)
+
+    content = json.dumps(netlist, indent = 1, sort_keys = True).encode('utf-8')
+    _write_if_changed(args.output, content + b'\n')
+
+    if args.name_map is not None:
+        content = json.dumps(names, indent = 1, sort_keys = True).encode('utf-8')
+        _write_if_changed(args.name_map, content + b'\n')
+    return 0
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def _tool_id(tool):
+    """Identify the version of the given tool, using both its `--version`
+    output and the content of its binary. The output catches tools installed as
+    wrapper scripts, the binary tools without a version option, such as icepack,
+    or development builds not changing their version string.
+    """
+    path = shutil.which(tool)
+    if path is None:
+        return b''
+
+    try:
+        version = subprocess.run([path, '--version'],
+            stdin = subprocess.DEVNULL,
+            stdout = subprocess.PIPE,
+            stderr = subprocess.STDOUT,
+            timeout = 10).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        version = b''
+
+    return version + b'\0' + _file_digest(path)
+
+
+def _wrapped_tool(command):
+    """Return the tool run by the given command, following any wrappers
+    which take the command they run after `--`, such as
+    nextpnr_incremental.py.
+    """
+    while '--' in command[:-1]:
+        command = command[command.index('--') + 1:]
+    return command[0]
+
+
+def _key(command, outputs):
+    h = hashlib.sha256()
+    h.update('\0'.join(command).encode('utf-8'))
+    h.update(b'\0' + _tool_id(command[0]))
+
+    # The wrapper is identified above, as its behaviour may change as well.
+    tool = _wrapped_tool(command)
+    if tool != command[0]:
+        h.update(b'\0' + _tool_id(tool))
+
+    for arg in command:
+        if arg in outputs or not os.path.isfile(arg):
+            continue
+        h.update(b'\0' + arg.encode('utf-8') + b'\0')
+        h.update(_file_digest(arg))
+
+    return h.hexdigest()
+
+
+def _restore(entry, outputs):
+    """Restore the outputs from the given cache entry, returning False if the
+    entry is incomplete or was pruned while reading it.
+    """
+    try:
+        contents = []
+        for i in range(len(outputs)):
+            with open(os.path.join(entry, str(i)), 'rb') as f:
+                contents.append(f.read())
+        # Mark the entry as recently used, keeping it from being pruned.
+        os.utime(entry)
+    except OSError:
+        return False
+
+    for output, content in zip(outputs, contents):
+        _write_if_changed(output, content)
+    return True
+
+
+def _prune(cache, max_age, max_size):
+    """Remove entries not used in the last `max_age` days, followed by the
+    least recently used entries until the cache is no larger than `max_size`
+    MiB.
+    """
+    entries = []
+    for shard in os.scandir(cache):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+            except OSError:
+                # Pruned by a concurrent build.
+                continue
+
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in sorted(entries):
+        if now - mtime <= max_age * 24 * 3600 and total <= max_size * 1024 * 1024:
+            break
+        shutil.rmtree(path, ignore_errors = True)
+        total -= size
+
+
+def _run_cmd(args):
+    command = args.command
+    if command and command[0] == '--':
+        command = command[1:]
+    if not command:
+        print('no command given', file = sys.stderr)
+        return 1
+
+    outputs = args.output
+    key = _key(command, outputs)
+    entry = os.path.join(args.cache, key[:2], key)
+
+    if _restore(entry, outputs):
+        return 0
+
+    returncode = subprocess.call(command)
+    if returncode != 0:
+        return returncode
+
+    # Populate the cache entry in a temporary directory first, so concurrent
+    # or interrupted builds never observe a partial entry.
+    os.makedirs(os.path.dirname(entry), exist_ok = True)
+    tmp = tempfile.mkdtemp(dir = os.path.dirname(entry))
+    for i, output in enumerate(outputs):
+        if os.path.exists(output):
+            shutil.copyfile(output, os.path.join(tmp, str(i)))
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # Another build populated the entry in the mean time.
+        shutil.rmtree(tmp)
+
+    _prune(args.cache, args.max_age, args.max_size)
+    return 0
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description = 'Netlist normalization and a content addressed cache for nextpnr')
+    subparsers = parser.add_subparsers(dest = 'cmd', required = True)
+
+    normalize_parser = subparsers.add_parser('normalize',
+            help = 'normalize a Yosys JSON netlist')
+    normalize_parser.add_argument('input', metavar = 'INPUT',
+            help = 'Yosys JSON netlist')
+    normalize_parser.add_argument('output', metavar = 'OUTPUT',
+            help = 'path of the normalized netlist')
+    normalize_parser.add_argument('--name-map', metavar = 'PATH',
+            help = 'path of a JSON file mapping the original to the normalized '
+                'name of each renamed cell and net, by module')
+    normalize_parser.set_defaults(go = _normalize_cmd)
+
+    run_parser = subparsers.add_parser('run',
+            help = 'run a command unless its outputs are found in the cache')
+    run_parser.add_argument('--cache', metavar = 'DIR', required = True,
+            help = 'cache directory')
+    run_parser.add_argument('--output', metavar = 'PATH', action = 'append',
+            default = [],
+            help = 'output of the command to be cached, may be repeated')
+    run_parser.add_argument('--max-age', metavar = 'DAYS', type = float,
+            default = 30,
+            help = 'remove entries not used in DAYS days (default: %(default)s)')
+    run_parser.add_argument('--max-size', metavar = 'MIB', type = float,
+            default = 4096,
+            help = 'remove the least recently used entries once the cache '
+                'exceeds MIB MiB (default: %(default)s)')
+    run_parser.add_argument('command', nargs = argparse.REMAINDER,
+            help = 'command to run, preceded by --')
+    run_parser.set_defaults(go = _run_cmd)
+
+    args = parser.parse_args(args[1:])
+    return args.go(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
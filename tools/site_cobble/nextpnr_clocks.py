@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Generate clock constraints for nextpnr from a netlist and board constraints.
+
+The frequency of the clocks entering the design is read from the board
+constraints, either `FREQUENCY PORT` in an LPF file or `set_frequency` in a
+PCF file. These are then followed through clock buffers and PLLs in the
+netlist, using the output frequencies recorded by `ECP5PLL` (as configured
+through the `ECP5PLLParameters` of a design) or computed from the dividers of
+the ECP5 and iCE40 PLL primitives.
+
+The result is a Python script to be passed to nextpnr using `--pre-pack`,
+adding a constraint for every clock found using `ctx.addClock`, so place and
+route optimizes each clock domain for its actual frequency rather than a
+default target. The script is only written if its content changed.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+_lpf_frequency_re = re.compile(
+        r'^\s*FREQUENCY\s+(?:PORT|NET)\s+"?([^"\s]+)"?\s+([\d.]+)\s*(MHZ|KHZ|HZ)\s*;',
+        re.IGNORECASE)
+_pcf_frequency_re = re.compile(r'^\s*set_frequency\s+(\S+)\s+([\d.]+)')
+
+_units = {
+    'mhz': 1.0,
+    'khz': 1e-3,
+    'hz': 1e-6,
+}
+
+
+def parse_constraints(lines):
+    """Parse the clock frequencies, in MHz, from LPF or PCF constraints."""
+    frequencies = {}
+    for line in lines:
+        line = line.split('#', 1)[0]
+        match = _lpf_frequency_re.match(line)
+        if match:
+            frequencies[match.group(1)] = float(match.group(2)) * _units[match.group(3).lower()]
+            continue
+        match = _pcf_frequency_re.match(line)
+        if match:
+            frequencies[match.group(1)] = float(match.group(2))
+    return frequencies
+
+
+def _value(v, default = 0):
+    """Decode a parameter or attribute value as written by Yosys, which writes
+    integers as binary strings and appends a space to strings which could be
+    mistaken for one.
+    """
+    if isinstance(v, int):
+        return v
+    if isinstance(v, str):
+        if v and set(v) <= set('01'):
+            return int(v, 2)
+        try:
+            return float(v.strip())
+        except ValueError:
+            pass
+    return default
+
+
+def _string(v):
+    return v.strip() if isinstance(v, str) else ''
+
+
+def _ecp5_pll(cell, f_in):
+    # Prefer the frequencies recorded by ECP5PLL, falling back to computing them from the
+    # dividers.
+    params = cell.get('parameters', {})
+    attributes = cell.get('attributes', {})
+
+    clki_div = _value(params.get('CLKI_DIV'), 1) or 1
+    clkfb_div = _value(params.get('CLKFB_DIV'), 1) or 1
+    feedback = _string(params.get('FEEDBK_PATH')) or 'CLKOP'
+    feedback_div = _value(params.get(feedback + '_DIV'), 1) or 1
+    f_vco = f_in / clki_div * clkfb_div * feedback_div
+
+    outputs = {}
+    for port in ('CLKOP', 'CLKOS', 'CLKOS2', 'CLKOS3'):
+        if _string(params.get(port + '_ENABLE')) == 'DISABLED':
+            continue
+        recorded = _value(attributes.get('FREQUENCY_PIN_' + port), 0)
+        divide = _value(params.get(port + '_DIV'), 0)
+        if recorded:
+            outputs[port] = float(recorded)
+        elif divide:
+            outputs[port] = f_vco / divide
+    return outputs
+
+
+def _ice40_pll(cell, f_in):
+    params = cell.get('parameters', {})
+    divr = _value(params.get('DIVR'))
+    divf = _value(params.get('DIVF'))
+    divq = _value(params.get('DIVQ'))
+
+    f_out = f_in * (divf + 1) / (divr + 1)
+    if _string(params.get('FEEDBACK_PATH')) in ('', 'SIMPLE'):
+        f_out /= 2 ** divq
+
+    return {
+        port: f_out
+        for port in ('PLLOUTCORE', 'PLLOUTGLOBAL',
+            'PLLOUTCOREA', 'PLLOUTGLOBALA', 'PLLOUTCOREB', 'PLLOUTGLOBALB')
+    }
+
+
+# Cells through which clocks are followed, mapping the type to the input
+# port and a function determining the frequency of the outputs.
+_sources = {
+    'EHXPLLL': ('CLKI', _ecp5_pll),
+    'SB_PLL40_CORE': ('REFERENCECLK', _ice40_pll),
+    'SB_PLL40_2F_CORE': ('REFERENCECLK', _ice40_pll),
+    'SB_PLL40_PAD': ('PACKAGEPIN', _ice40_pll),
+    'SB_PLL40_2_PAD': ('PACKAGEPIN', _ice40_pll),
+    'SB_PLL40_2F_PAD': ('PACKAGEPIN', _ice40_pll),
+    'DCCA': ('CLKI', lambda _, f: {'CLKO': f}),
+    'DCSC': ('CLK0', lambda _, f: {'DCSOUT': f}),
+    'SB_GB': ('USER_SIGNAL_TO_GLOBAL_BUFFER', lambda _, f: {'GLOBAL_BUFFER_OUTPUT': f}),
+}
+
+
+def _top_module(netlist):
+    modules = netlist.get('modules', {})
+    for name, module in modules.items():
+        if _value(module.get('attributes', {}).get('top')):
+            return module
+    if len(modules) == 1:
+        return next(iter(modules.values()))
+    raise ValueError('unable to determine the top module of the netlist')
+
+
+def _net_names(module):
+    names = {}
+    for name, net in sorted(module.get('netnames', {}).items(),
+            key = lambda n: (n[0].startswith('$'), n[1].get('hide_name', 0), len(n[0]))):
+        bits = net.get('bits', [])
+        if len(bits) == 1 and isinstance(bits[0], int):
+            names.setdefault(bits[0], name)
+    return names
+
+
+def derive_clocks(netlist, frequencies):
+    """Determine the frequency of each clock net in the top module of the
+    netlist, starting from the given frequencies of its ports.
+    """
+    module = _top_module(netlist)
+
+    clocks = {}
+    for name, port in module.get('ports', {}).items():
+        bits = port.get('bits', [])
+        if name in frequencies and len(bits) == 1 and isinstance(bits[0], int):
+            clocks[bits[0]] = frequencies[name]
+
+    # Follow clocks through buffers and PLLs until no more are found. Each cell is visited
+    # once, so clocks feeding back through a PLL do not cause this to loop.
+    pending = {
+        name: cell
+        for name, cell in module.get('cells', {}).items()
+        if cell['type'] in _sources
+    }
+    progress = True
+    while pending and progress:
+        progress = False
+        for name, cell in list(pending.items()):
+            input_port, outputs = _sources[cell['type']]
+            connections = cell.get('connections', {})
+            bits = connections.get(input_port, [])
+            if len(bits) != 1 or bits[0] not in clocks:
+                continue
+
+            del pending[name]
+            progress = True
+            for port, f in outputs(cell, clocks[bits[0]]).items():
+                out = connections.get(port, [])
+                if len(out) == 1 and isinstance(out[0], int) and f > 0:
+                    clocks.setdefault(out[0], f)
+
+    names = _net_names(module)
+    return {
+        names[bit]: f
+        for bit, f in clocks.items()
+        if bit in names
+    }
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description = 'Generate clock constraints for nextpnr')
+
+    parser.add_argument('--constraints', metavar = 'PATH', action = 'append', default = [],
+            help = 'LPF or PCF board constraints, may be repeated')
+    parser.add_argument('--output', metavar = 'PATH', required = True,
+            help = 'path of the generated pre-pack script')
+    parser.add_argument('netlist', metavar = 'NETLIST',
+            help = 'Yosys JSON netlist')
+
+    args = parser.parse_args(args[1:])
+
+    frequencies = {}
+    for path in args.constraints:
+        with open(path, 'r') as f:
+            frequencies.update(parse_constraints(f.read().splitlines()))
+
+    with open(args.netlist, 'r') as f:
+        clocks = derive_clocks(json.load(f), frequencies)
+
+    lines = [
+        '# Clock constraints generated by nextpnr_clocks.py, do not edit.',
+    ] + [
+        'ctx.addClock(%s, %s)' % (json.dumps(name), round(f, 6))
+        for name, f in sorted(clocks.items())
+    ]
+    content = '\n'.join(lines) + '\n'
+
+    if os.path.exists(args.output):
+        with open(args.output, 'r') as f:
+            if f.read() == content:
+                return 0
+    with open(args.output, 'w') as f:
+        f.write(content)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Place and route a design incrementally, reusing the previous placement.
+
+Wraps a nextpnr command. After each run the placement of every cell is saved
+in a state directory, along with the nets connected to it. On the next run a
+pre-place script locks each cell whose type and connections did not change to
+its previous location, leaving the placer and router to deal with new or
+modified logic only. Netlists normalized by nextpnr_cache.py keep the names of
+unchanged cells and nets stable, which is what makes this effective.
+
+If the incremental run fails or reaches a lower timing margin than the run it
+started from, the design is placed and routed again from scratch. A summary of
+the run, including the time saved compared to the last full run, is appended
+to the nextpnr log.
+
+Usage: nextpnr_incremental.py --state DIR -- NEXTPNR ...
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import nextpnr_report
+
+_lock_script = '''\
+import json
+
+with open({placement!r}, 'r') as f:
+    placement = json.load(f)
+
+locked = 0
+cells = 0
+for name, cell in ctx.cells:
+    cells += 1
+    previous = placement.get(name)
+    if previous is None or previous['type'] != cell.type:
+        continue
+    ports = {{
+        port_name: port.net.name
+        for port_name, port in cell.ports
+        if port.net is not None
+    }}
+    if ports != previous['ports']:
+        continue
+    cell.setAttr('BEL', previous['bel'])
+    locked += 1
+
+with open({stats!r}, 'w') as f:
+    json.dump({{'locked': locked, 'cells': cells}}, f)
+'''
+
+
+def extract_placement(routed):
+    """Return a dict of cell name to its type, location and the names of the
+    nets connected to each of its ports, from a netlist written by nextpnr
+    after routing.
+    """
+    placement = {}
+    for module in routed.get('modules', {}).values():
+        names = {}
+        for name, net in sorted(module.get('netnames', {}).items()):
+            for bit in net.get('bits', []):
+                names.setdefault(bit, name)
+
+        for name, cell in module.get('cells', {}).items():
+            bel = cell.get('attributes', {}).get('NEXTPNR_BEL')
+            if not bel:
+                continue
+            placement[name] = {
+                'type': cell['type'],
+                'bel': bel,
+                'ports': {
+                    port: names[bits[0]]
+                    for port, bits in cell.get('connections', {}).items()
+                    if len(bits) == 1 and bits[0] in names
+                },
+            }
+    return placement
+
+
+def _log_path(command):
+    for flag in ('-l', '--log'):
+        if flag in command[:-1]:
+            return command[command.index(flag) + 1]
+    return None
+
+
+def _run(command, log_path):
+    start = time.monotonic()
+    returncode = subprocess.call(command)
+    seconds = time.monotonic() - start
+
+    margin = None
+    if returncode == 0 and log_path is not None and os.path.exists(log_path):
+        with open(log_path, 'r') as f:
+            margin = nextpnr_report.timing_margin(nextpnr_report.parse_clocks(f))
+    return returncode, seconds, margin
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description = 'Place and route a design incrementally')
+    parser.add_argument('--state', metavar = 'DIR', required = True,
+            help = 'directory holding the placement and summary of the previous run')
+    parser.add_argument('command', nargs = argparse.REMAINDER,
+            help = 'nextpnr command, preceded by --')
+
+    args = parser.parse_args(args[1:])
+
+    command = args.command
+    if command and command[0] == '--':
+        command = command[1:]
+    if not command:
+        print('no command given', file = sys.stderr)
+        return 1
+
+    log_path = _log_path(command)
+    placement_path = os.path.join(args.state, 'placement.json')
+    summary_path = os.path.join(args.state, 'summary.json')
+    routed_path = os.path.join(args.state, 'routed.json')
+    script_path = os.path.join(args.state, 'lock.py')
+    stats_path = os.path.join(args.state, 'lock.json')
+
+    os.makedirs(args.state, exist_ok = True)
+
+    previous = {}
+    if os.path.exists(summary_path):
+        with open(summary_path, 'r') as f:
+            previous = json.load(f)
+
+    write = ['--write', routed_path]
+    mode = 'full'
+    stats = None
+
+    if os.path.exists(placement_path):
+        if os.path.exists(stats_path):
+            os.remove(stats_path)
+        with open(script_path, 'w') as f:
+            f.write(_lock_script.format(placement = placement_path, stats = stats_path))
+
+        returncode, seconds, margin = _run(
+            command + write + ['--pre-place', script_path], log_path)
+        if os.path.exists(stats_path):
+            with open(stats_path, 'r') as f:
+                stats = json.load(f)
+
+        previous_margin = previous.get('margin')
+        if returncode != 0:
+            mode = 'full (incremental run failed)'
+        elif margin is not None and previous_margin is not None and margin < previous_margin:
+            mode = 'full (incremental run reached a margin of %.3f, previously %.3f)' % (
+                margin, previous_margin)
+        else:
+            mode = 'incremental'
+
+    if mode != 'incremental':
+        stats = None
+        returncode, seconds, margin = _run(command + write, log_path)
+        if returncode != 0:
+            return returncode
+
+    with open(routed_path, 'r') as f:
+        placement = extract_placement(json.load(f))
+    os.remove(routed_path)
+
+    with open(placement_path + '.tmp', 'w') as f:
+        json.dump(placement, f)
+    os.replace(placement_path + '.tmp', placement_path)
+
+    full_seconds = seconds if mode != 'incremental' else previous.get('full_seconds')
+    with open(summary_path, 'w') as f:
+        json.dump({
+            'margin': margin,
+            'seconds': seconds,
+            'full_seconds': full_seconds,
+        }, f, indent = 4, sort_keys = True)
+
+    # Append a summary to the log, so it is part of the report of the design.
+    if log_path is not None:
+        with open(log_path, 'a') as f:
+            print(f"Info: Incremental place and route: {mode} run in {seconds:.2f}s", file = f)
+            if stats is not None:
+                print(f"Info: Incremental place and route: locked {stats['locked']} of "
+                    f"{stats['cells']} cells to their previous location", file = f)
+            if mode == 'incremental' and full_seconds is not None:
+                print(f"Info: Incremental place and route: saved "
+                    f"{full_seconds - seconds:.2f}s compared to the last full run", file = f)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,757 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Read the logs written by nextpnr.
+
+The `report` command extracts the achieved frequency of each clock, the delays
+of the critical paths and the device utilization from a log into JSON, failing
+if any of the given minimum frequency or maximum utilization thresholds are
+violated.
+
+The `select` command picks the best of a number of place and route runs of
+the same design using different seeds, copying its outputs into place for the
+packing step and writing a summary of all runs.
+
+The `sweep` command tabulates the reports of a design built using different
+synthesis strategies.
+
+The `annotate` command maps each hop of the critical paths in a log back to
+the source of the design, using the `src` attributes in the Yosys netlist to
+find the line of bsc generated Verilog, the rule (`WILL_FIRE_RL_*`) or state
+element driving it and the line of BSV declaring that rule or state element.
+
+The `bitstream` command reports the size of a bitstream and an estimate of
+the time taken to load it from SPI flash.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+
+from itertools import chain
+
+_fmax_re = re.compile(
+    r"Max frequency for clock\s+'([^']+)':\s+([\d.]+) MHz "
+    r"\((PASS|FAIL) at ([\d.]+) MHz\)")
+
+
+def parse_clocks(lines):
+    """Return a dict of clock name to a dict with the achieved and target
+    frequency in MHz. nextpnr reports these after placement and after routing,
+    only the last report for each clock is kept.
+    """
+    clocks = {}
+    for line in lines:
+        match = _fmax_re.search(line)
+        if match:
+            clocks[match.group(1)] = {
+                'fmax': float(match.group(2)),
+                'target': float(match.group(4)),
+                'pass': match.group(3) == 'PASS',
+            }
+    return clocks
+
+
+_critical_path_re = re.compile(
+    r"Critical path report for (?:clock '([^']+)'|cross-domain path '([^']+)' -> '([^']+)')")
+_path_delay_re = re.compile(r'([\d.]+) ns logic, ([\d.]+) ns routing')
+
+
+def parse_critical_paths(lines):
+    """Return a dict of clock (or cross-domain path) to the logic, routing and
+    total delay of its critical path in ns, keeping the last report of each.
+    """
+    paths = {}
+    current = None
+    for line in lines:
+        match = _critical_path_re.search(line)
+        if match:
+            current = match.group(1) or f"{match.group(2)} -> {match.group(3)}"
+            continue
+
+        match = _path_delay_re.search(line)
+        if match and current is not None:
+            logic = float(match.group(1))
+            routing = float(match.group(2))
+            paths[current] = {
+                'logic': logic,
+                'routing': routing,
+                'total': round(logic + routing, 3),
+            }
+            current = None
+    return paths
+
+
+_utilization_header_re = re.compile(r'Device utili[sz]ation:')
+_utilization_re = re.compile(r'^Info:\s+([\w$]+):\s+(\d+)/\s*(\d+)\s+\d+%')
+
+# Resource classes of the primitives reported by nextpnr for the supported
+# families. Note that an ICESTORM_LC holds both a LUT and a FF.
+_resource_classes = {
+    'TRELLIS_SLICE': 'lut',
+    'TRELLIS_COMB': 'lut',
+    'ICESTORM_LC': 'lut',
+    'TRELLIS_FF': 'ff',
+    'DP16KD': 'bram',
+    'ICESTORM_RAM': 'bram',
+    'MULT18X18D': 'dsp',
+    'ICESTORM_DSP': 'dsp',
+    'TRELLIS_IO': 'io',
+    'SB_IO': 'io',
+}
+
+
+def parse_utilization(lines):
+    """Return a dict of primitive name to its used and available count from
+    the last device utilization report in the log.
+    """
+    resources = {}
+    in_report = False
+    for line in lines:
+        if _utilization_header_re.search(line):
+            resources = {}
+            in_report = True
+            continue
+
+        if in_report:
+            match = _utilization_re.match(line)
+            if match:
+                resources[match.group(1)] = {
+                    'used': int(match.group(2)),
+                    'available': int(match.group(3)),
+                }
+            elif line.strip() != 'Info:':
+                in_report = False
+    return resources
+
+
+def summarize_utilization(resources):
+    """Sum the given resources by class, adding the percentage used."""
+    classes = {}
+    for name, r in resources.items():
+        cls = _resource_classes.get(name)
+        if cls is None:
+            continue
+        c = classes.setdefault(cls, {'used': 0, 'available': 0})
+        c['used'] += r['used']
+        c['available'] += r['available']
+
+    for c in chain(classes.values(), resources.values()):
+        c['percent'] = 100 * c['used'] / c['available'] if c['available'] else 0.0
+    return classes
+
+
+# Runtime of the placer and router phases, e.g. `HeAP Placer Time: 1.23s` or
+# `Router1 time 4.56s`.
+_runtime_re = re.compile(r'^Info:\s+(\w[\w ]*?)\s+[Tt]ime:?\s+([\d.]+)s\b')
+_cpu_re = re.compile(r'CPU: user ([\d.]+)s system ([\d.]+)s')
+
+
+def parse_runtime(lines):
+    """Return a dict of phase to the runtime in seconds reported by nextpnr."""
+    phases = {}
+    for line in lines:
+        match = _runtime_re.match(line)
+        if match:
+            phases[match.group(1)] = phases.get(match.group(1), 0.0) + \
+                float(match.group(2))
+    return phases
+
+
+_incremental_mode_re = re.compile(r'Incremental place and route: (.*) run in ([\d.]+)s')
+_incremental_locked_re = re.compile(r'Incremental place and route: locked (\d+) of (\d+) cells')
+_incremental_saved_re = re.compile(r'Incremental place and route: saved (-?[\d.]+)s')
+
+
+def parse_incremental(lines):
+    """Return the summary appended by nextpnr_incremental.py, or None if the
+    design was not placed and routed incrementally.
+    """
+    summary = None
+    for line in lines:
+        match = _incremental_mode_re.search(line)
+        if match:
+            summary = {
+                'mode': match.group(1),
+                'seconds': float(match.group(2)),
+            }
+            continue
+        if summary is None:
+            continue
+        match = _incremental_locked_re.search(line)
+        if match:
+            summary['locked'] = int(match.group(1))
+            summary['cells'] = int(match.group(2))
+        match = _incremental_saved_re.search(line)
+        if match:
+            summary['saved_seconds'] = float(match.group(1))
+    return summary
+
+
+def parse_synthesis_runtime(lines):
+    """Return the CPU time reported in the footer of a Yosys log."""
+    seconds = None
+    for line in lines:
+        match = _cpu_re.search(line)
+        if match:
+            seconds = float(match.group(1)) + float(match.group(2))
+    return seconds
+
+
+def _threshold(s):
+    """Parse a threshold of the form VALUE or NAME=VALUE."""
+    name, _, value = s.rpartition('=')
+    return (name or None, float(value))
+
+
+def _report_cmd(args):
+    lines = args.log.read().splitlines()
+
+    clocks = parse_clocks(lines)
+    resources = parse_utilization(lines)
+    report = {
+        'clocks': clocks,
+        'critical_paths': parse_critical_paths(lines),
+        'utilization': summarize_utilization(resources),
+        'resources': resources,
+        'runtime': parse_runtime(lines),
+        'incremental': parse_incremental(lines),
+    }
+
+    if args.synthesis_log is not None:
+        report['synthesis_runtime'] = \
+            parse_synthesis_runtime(args.synthesis_log.read().splitlines())
+
+    # Check the thresholds. Clocks are matched by substring, as the names of
+    # clock nets are mangled by Yosys and nextpnr.
+    violations = []
+    for name, mhz in args.min_fmax:
+        for clock, c in sorted(clocks.items()):
+            if (name is None or name in clock) and c['fmax'] < mhz:
+                violations.append(
+                    f"clock '{clock}' reached {c['fmax']:.2f} MHz, "
+                    f"below the minimum of {mhz:.2f} MHz")
+
+    for name, percent in args.max_utilization:
+        for resource, r in sorted(chain(
+                report['utilization'].items(),
+                resources.items())):
+            if (name is None and resource in report['utilization'] or
+                    name == resource) and r['percent'] > percent:
+                violations.append(
+                    f"{resource} utilization is {r['percent']:.1f}%, "
+                    f"above the maximum of {percent:.1f}%")
+
+    report['violations'] = violations
+
+    with open(args.json, 'w') as f:
+        json.dump(report, f, indent = 4, sort_keys = True)
+
+    for v in violations:
+        print(f"{args.log.name}: {v}", file = sys.stderr)
+
+    return 1 if violations else 0
+
+
+def timing_margin(clocks):
+    """Return the ratio of achieved to target frequency of the clock with the
+    least margin, or None if no clocks were reported.
+    """
+    if not clocks:
+        return None
+    return min(c['fmax'] / c['target'] for c in clocks.values())
+
+
+def _select_cmd(args):
+    runs = []
+    for config in args.configs:
+        with open(config + '.log', 'r') as f:
+            clocks = parse_clocks(f)
+        runs.append((config, clocks, timing_margin(clocks)))
+
+    # Prefer the run with the largest margin on its tightest clock, falling
+    # back to the first run if no timing was reported at all.
+    best = max(runs, key = lambda r: r[2] if r[2] is not None else -1)
+    shutil.copyfile(best[0], args.config)
+    shutil.copyfile(best[0] + '.log', args.config + '.log')
+
+    # Runs are listed by the file name of their config, e.g. `top.seed3.config`,
+    # as the build directories leading up to it only differ by a hash.
+    clock_names = sorted(set(name for _, clocks, _ in runs for name in clocks))
+    run_width = max(len(os.path.basename(config)) for config, _, _ in runs)
+    with open(args.summary, 'w') as f:
+        print(f"{'Run':<{run_width}} {'Margin':>8} " +
+            ' '.join(f"{name:>24.24}" for name in clock_names), file = f)
+        for config, clocks, margin in runs:
+            margin_str = f"{margin:>8.3f}" if margin is not None else f"{'-':>8}"
+            fmax = ' '.join(
+                f"{clocks[name]['fmax']:>20.2f} MHz" if name in clocks else f"{'-':>24}"
+                for name in clock_names)
+            selected = '  <- selected' if config == best[0] else ''
+            print(f"{os.path.basename(config):<{run_width}} {margin_str} {fmax}{selected}",
+                file = f)
+
+    return 0
+
+
+def _sweep_cmd(args):
+    rows = []
+    for arg in args.reports:
+        strategy, _, path = arg.partition('=')
+        with open(path, 'r') as f:
+            report = json.load(f)
+        rows.append((strategy, report))
+
+    summary = {}
+    for strategy, report in rows:
+        summary[strategy] = {
+            'fmax': {c: v['fmax'] for c, v in report['clocks'].items()},
+            'margin': timing_margin(report['clocks']),
+            'utilization': {
+                c: v['used'] for c, v in report['utilization'].items()
+            },
+            'pnr_seconds': sum(report.get('runtime', {}).values()),
+            'synthesis_seconds': report.get('synthesis_runtime'),
+        }
+
+    with open(args.json, 'w') as f:
+        json.dump(summary, f, indent = 4, sort_keys = True)
+
+    clock_names = sorted(set(c for s in summary.values() for c in s['fmax']))
+    classes = sorted(set(c for s in summary.values() for c in s['utilization']))
+
+    with open(args.output, 'w') as f:
+        print(f"{'Strategy':<20} {'Margin':>8} " +
+            ''.join(f" {c[:20]:>20}" for c in clock_names) +
+            ''.join(f" {c:>8}" for c in classes) +
+            f" {'Synth(s)':>9} {'PnR(s)':>9}", file = f)
+        for strategy, s in summary.items():
+            margin = f"{s['margin']:>8.3f}" if s['margin'] is not None else f"{'-':>8}"
+            fmax = ''.join(
+                f" {s['fmax'][c]:>16.2f} MHz" if c in s['fmax'] else f" {'-':>20}"
+                for c in clock_names)
+            used = ''.join(
+                f" {s['utilization'][c]:>8}" if c in s['utilization'] else f" {'-':>8}"
+                for c in classes)
+            synth = f"{s['synthesis_seconds']:>9.2f}" \
+                if s['synthesis_seconds'] is not None else f"{'-':>9}"
+            print(f"{strategy:<20} {margin}{fmax}{used} {synth} {s['pnr_seconds']:>9.2f}",
+                file = f)
+
+    return 0
+
+
+_hop_re = re.compile(r'^Info:\s+(?:\S+\s+)?([\d.]+)\s+([\d.]+)\s+(Source|Net|Setup|Sink)\s+(\S+)')
+_sink_re = re.compile(r'^Info:\s+Sink\s+(\S+)')
+_defined_in_re = re.compile(r'^Info:\s+Defined in:')
+_src_re = re.compile(r'([^\s|:]+\.s?v):(\d+)(?:\.\d+(?:-(\d+)\.\d+)?)?')
+
+
+def parse_critical_path_hops(lines):
+    """Return a dict of clock (or cross-domain path) to the list of hops of
+    its critical path, each with its kind (Source, Net or Sink), the name of
+    the cell or net, its delay and any source locations nextpnr reported.
+    """
+    paths = {}
+    current = None
+    hops = []
+    in_defined = False
+    for line in lines:
+        match = _critical_path_re.search(line)
+        if match:
+            current = match.group(1) or f"{match.group(2)} -> {match.group(3)}"
+            hops = []
+            in_defined = False
+            continue
+        if current is None:
+            continue
+
+        if _path_delay_re.search(line):
+            paths[current] = hops
+            current = None
+            continue
+
+        match = _hop_re.match(line)
+        if match:
+            in_defined = False
+            hops.append({
+                'kind': match.group(3),
+                'name': match.group(4),
+                'delay': float(match.group(1)),
+                'total': float(match.group(2)),
+                'src': [],
+            })
+            continue
+
+        match = _sink_re.match(line)
+        if match:
+            in_defined = False
+            hops.append({
+                'kind': 'Sink',
+                'name': match.group(1),
+                'delay': 0.0,
+                'total': hops[-1]['total'] if hops else 0.0,
+                'src': [],
+            })
+            continue
+
+        if _defined_in_re.match(line):
+            in_defined = True
+            continue
+
+        if in_defined and hops:
+            hops[-1]['src'].extend(m.group(0) for m in _src_re.finditer(line))
+    return paths
+
+
+def _netlist_src(netlist, name_map = {}):
+    """Return a dict of cell and net names to their `src` attribute across
+    all modules of a Yosys JSON netlist. The netlist placed and routed by
+    nextpnr is normalized, which strips these attributes and renames some
+    cells and nets. Given the name map written by normalizing the netlist,
+    the names are those of the normalized netlist, as reported by nextpnr.
+    """
+    src = {}
+    for module_name, module in netlist.get('modules', {}).items():
+        names = name_map.get(module_name, {})
+        for kind in ('cells', 'netnames'):
+            for name, item in module.get(kind, {}).items():
+                location = item.get('attributes', {}).get('src')
+                if location:
+                    src.setdefault(names.get(name, name), location)
+    return src
+
+
+def _lookup_src(src, name):
+    """Find the source of a cell or net named by nextpnr. Cells are named
+    after a port in the critical path and packing adds suffixes to the
+    names of cells, so strip these until a match is found. Nets are named
+    by bit.
+    """
+    candidates = [name, re.sub(r'\[\d+\]$', '', name)]
+    if '.' in name:
+        candidates.append(name.rsplit('.', 1)[0])
+    for candidate in list(candidates):
+        parts = candidate.split('_')
+        candidates.extend('_'.join(parts[:i]) for i in range(len(parts) - 1, 0, -1))
+
+    for candidate in candidates:
+        if candidate in src:
+            return src[candidate]
+    return ''
+
+
+_rule_signal_re = re.compile(r'\b(?:WILL_FIRE|CAN_FIRE)_(RL_\w+)')
+_rule_re = re.compile(r'\bRL_(\w+)')
+_state_re = re.compile(r'\b(\w+?)\$(?:D_IN|EN|whas|wget|enq|deq|FULL_N|EMPTY_N|D_OUT)\b')
+_assign_re = re.compile(r'^\s*(?:assign\s+)?([A-Za-z_]\w*)\s*(?:\[[^\]]*\])?\s*<?=')
+
+_bsv_rule_re = re.compile(r'^\s*rule\s+(\w+)')
+_bsv_state_re = re.compile(r'\b(\w+)\s*<-\s*\w+')
+
+
+def index_bsv(dirs):
+    """Index the rules and instantiated modules (registers, FIFOs, ...)
+    declared in the BSV files found in the given directories.
+    """
+    rules = {}
+    state = {}
+    for d in dirs:
+        for root, _, files in os.walk(d):
+            for f in sorted(files):
+                if not f.endswith('.bsv'):
+                    continue
+                path = os.path.join(root, f)
+                with open(path, 'r', errors = 'replace') as source:
+                    for number, line in enumerate(source, 1):
+                        match = _bsv_rule_re.match(line)
+                        if match:
+                            rules.setdefault(match.group(1), []).append((path, number))
+                        for match in _bsv_state_re.finditer(line):
+                            state.setdefault(match.group(1), []).append((path, number))
+    return rules, state
+
+
+def _find_declaration(index, name):
+    """Find the declaration of a rule or state element of a bsc generated
+    module. Names of rules and instances in submodules inlined by bsc are
+    prefixed with the instance names, so drop these one at a time.
+    """
+    parts = name.split('_')
+    for i in range(len(parts)):
+        locations = index.get('_'.join(parts[i:]))
+        if locations:
+            return '_'.join(parts[i:]), locations
+    return None, []
+
+
+def _verilog_lines(cache, path, first, last):
+    if path not in cache:
+        try:
+            with open(path, 'r', errors = 'replace') as f:
+                cache[path] = f.read().splitlines()
+        except OSError:
+            cache[path] = []
+    return cache[path][first - 1:last]
+
+
+def annotate_hop(hop, src, verilog, rules, state):
+    """Determine the Verilog lines, rules and state elements and their BSV
+    declarations for a hop of a critical path.
+    """
+    locations = hop['src'] or _lookup_src(src, hop['name']).split('|')
+
+    annotations = []
+    for location in locations:
+        match = _src_re.search(location)
+        if not match:
+            continue
+        path = match.group(1)
+        first = int(match.group(2))
+        last = int(match.group(3) or first)
+        lines = _verilog_lines(verilog, path, first, min(last, first + 5))
+        text = ' '.join(l.strip() for l in lines)
+
+        found = []
+        for r in _rule_signal_re.findall(text) or _rule_re.findall(text):
+            name = r[3:] if r.startswith('RL_') else r
+            declared, bsv = _find_declaration(rules, name)
+            found.append(('rule', declared or name, bsv))
+        if not found:
+            names = _state_re.findall(text)
+            match = _assign_re.match(text)
+            if match:
+                names.append(match.group(1))
+            for n in dict.fromkeys(names):
+                declared, bsv = _find_declaration(state, n)
+                if declared is not None:
+                    found.append(('state', declared, bsv))
+
+        annotations.append({
+            'verilog': f"{path}:{first}",
+            'text': text,
+            'bsv': [
+                {
+                    'kind': kind,
+                    'name': name,
+                    'locations': [f"{p}:{n}" for p, n in bsv],
+                }
+                for kind, name, bsv in found
+            ],
+        })
+    return annotations
+
+
+def _annotate_cmd(args):
+    lines = args.log.read().splitlines()
+    paths = parse_critical_path_hops(lines)
+
+    src = {}
+    if args.netlist is not None:
+        name_map = json.load(args.name_map) if args.name_map is not None else {}
+        src = _netlist_src(json.load(args.netlist), name_map)
+    rules, state = index_bsv(args.bsv_dir)
+    verilog = {}
+
+    for hops in paths.values():
+        for hop in hops:
+            hop['annotations'] = annotate_hop(hop, src, verilog, rules, state)
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(paths, f, indent = 4, sort_keys = True)
+
+    with open(args.output, 'w') as f:
+        for clock, hops in paths.items():
+            total = hops[-1]['total'] if hops else 0.0
+            print(f"Critical path for '{clock}' ({total:.2f} ns)", file = f)
+            for hop in hops:
+                print(f"  {hop['delay']:>6.2f} {hop['total']:>7.2f}  "
+                    f"{hop['kind']:<6} {hop['name']}", file = f)
+                for a in hop['annotations']:
+                    print(f"{'':>19}{a['verilog']}: {a['text'][:80]}", file = f)
+                    for b in a['bsv']:
+                        where = ', '.join(b['locations'][:3]) or 'declaration not found'
+                        print(f"{'':>21}{b['kind']} {b['name']}: {where}", file = f)
+            print(file = f)
+
+    return 0
+
+
+# Default frequency in MHz of the clock used by each family to read its
+# configuration from SPI flash, if not set when packing the bitstream or
+# through SYSCONFIG MCCLK_FREQ.
+_default_spi_frequency = {
+    'ecp5': 2.4,
+    'ice40': 12.0,
+}
+
+# Number of data lines used by each SPI read mode.
+_spi_widths = {
+    'single': 1,
+    'fast-read': 1,
+    'dual-spi': 2,
+    'qspi': 4,
+}
+
+_sysconfig_re = re.compile(r'^\.sysconfig\s+(\w+)\s+(\S+)')
+
+
+def parse_sysconfig(lines):
+    """Return the SYSCONFIG settings found in an ECP5 text configuration."""
+    sysconfig = {}
+    for line in lines:
+        match = _sysconfig_re.match(line)
+        if match:
+            sysconfig[match.group(1)] = match.group(2)
+    return sysconfig
+
+
+def _bitstream_cmd(args):
+    size = os.path.getsize(args.bitstream)
+
+    sysconfig = {}
+    if args.config is not None:
+        sysconfig = parse_sysconfig(args.config.read().splitlines())
+
+    # Flags given when packing take precedence over the SYSCONFIG settings
+    # in the configuration, as is the case for ecppack.
+    frequency = args.spi_frequency
+    if frequency is None and 'MCCLK_FREQ' in sysconfig:
+        frequency = float(sysconfig['MCCLK_FREQ'])
+    if frequency is None:
+        frequency = _default_spi_frequency[args.family]
+
+    mode = args.spi_mode or 'single'
+    width = _spi_widths[mode]
+    compressed = args.compress or sysconfig.get('COMPRESS_CONFIG') == 'ON'
+
+    # The estimate only accounts for shifting in the bitstream, not for the
+    # time taken by the device to wake up.
+    load_ms = size * 8 / (frequency * 1e6 * width) * 1e3
+
+    report = {
+        'family': args.family,
+        'bytes': size,
+        'compressed': compressed,
+        'spi_mode': mode,
+        'spi_frequency': frequency,
+        'load_ms': round(load_ms, 3),
+    }
+
+    with open(args.json, 'w') as f:
+        json.dump(report, f, indent = 4, sort_keys = True)
+
+    with open(args.output, 'w') as f:
+        print(f"Bitstream:       {args.bitstream}", file = f)
+        print(f"Size:            {size} bytes ({size / 1024:.1f} KiB"
+            f"{', compressed' if compressed else ''})", file = f)
+        print(f"SPI:             {mode}, {frequency:g} MHz", file = f)
+        print(f"Load time:       {load_ms:.1f} ms (estimated)", file = f)
+
+    return 0
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description = 'Read the logs written by nextpnr')
+    subparsers = parser.add_subparsers(dest = 'cmd', required = True)
+
+    report_parser = subparsers.add_parser('report',
+            help = 'extract timing and utilization from a log into JSON')
+    report_parser.add_argument('--json', metavar = 'PATH', required = True,
+            help = 'path of the JSON report')
+    report_parser.add_argument('--min-fmax', metavar = '[CLOCK=]MHZ',
+            type = _threshold, action = 'append', default = [],
+            help = 'fail if any clock, or those with CLOCK in their name, '
+                'does not reach MHZ')
+    report_parser.add_argument('--max-utilization', metavar = '[RESOURCE=]PCT',
+            type = _threshold, action = 'append', default = [],
+            help = 'fail if any resource class (lut, ff, bram, dsp, io), or '
+                'the given class or primitive, is more than PCT percent used')
+    report_parser.add_argument('--synthesis-log', metavar = 'PATH',
+            type = argparse.FileType('r'),
+            help = 'log written by Yosys when synthesizing the design, used to '
+                'include the synthesis runtime in the report')
+    report_parser.add_argument('log', metavar = 'LOG',
+            type = argparse.FileType('r'),
+            help = 'log written by nextpnr')
+    report_parser.set_defaults(go = _report_cmd)
+
+    select_parser = subparsers.add_parser('select',
+            help = 'select the best of a number of place and route runs')
+    select_parser.add_argument('--config', metavar = 'PATH', required = True,
+            help = 'path to copy the selected configuration to, its log is '
+                'copied to PATH.log')
+    select_parser.add_argument('--summary', metavar = 'PATH', required = True,
+            help = 'path of the summary of all runs')
+    select_parser.add_argument('configs', metavar = 'CONFIG', nargs = '+',
+            help = 'configuration written by a run, with its log in CONFIG.log')
+    select_parser.set_defaults(go = _select_cmd)
+
+    sweep_parser = subparsers.add_parser('sweep',
+            help = 'tabulate the reports of a synthesis strategy sweep')
+    sweep_parser.add_argument('--output', metavar = 'PATH', required = True,
+            help = 'path of the summary table')
+    sweep_parser.add_argument('--json', metavar = 'PATH', required = True,
+            help = 'path of the summary in JSON')
+    sweep_parser.add_argument('reports', metavar = 'STRATEGY=REPORT', nargs = '+',
+            help = 'JSON report written by the report command for a strategy')
+    sweep_parser.set_defaults(go = _sweep_cmd)
+
+    annotate_parser = subparsers.add_parser('annotate',
+            help = 'map the critical paths in a log back to the source of the design')
+    annotate_parser.add_argument('--output', metavar = 'PATH', required = True,
+            help = 'path of the annotated critical paths')
+    annotate_parser.add_argument('--json', metavar = 'PATH',
+            help = 'path of the annotated critical paths in JSON')
+    annotate_parser.add_argument('--netlist', metavar = 'PATH',
+            type = argparse.FileType('r'),
+            help = 'Yosys JSON netlist, with src attributes, of the design')
+    annotate_parser.add_argument('--name-map', metavar = 'PATH',
+            type = argparse.FileType('r'),
+            help = 'names of the cells and nets renamed when normalizing the netlist, '
+                'as written by `nextpnr_cache.py normalize`')
+    annotate_parser.add_argument('--bsv-dir', metavar = 'DIR', action = 'append', default = [],
+            help = 'directory searched for the BSV sources of the design, may be repeated')
+    annotate_parser.add_argument('log', metavar = 'LOG',
+            type = argparse.FileType('r'),
+            help = 'log written by nextpnr')
+    annotate_parser.set_defaults(go = _annotate_cmd)
+
+    bitstream_parser = subparsers.add_parser('bitstream',
+            help = 'report the size and estimated load time of a bitstream')
+    bitstream_parser.add_argument('--family', required = True,
+            choices = sorted(_default_spi_frequency),
+            help = 'device family of the bitstream')
+    bitstream_parser.add_argument('--config', metavar = 'PATH',
+            type = argparse.FileType('r'),
+            help = 'text configuration the bitstream was packed from, read for '
+                'SYSCONFIG settings')
+    bitstream_parser.add_argument('--compress', action = 'store_true',
+            help = 'the bitstream was packed with compression')
+    bitstream_parser.add_argument('--spi-mode', choices = sorted(_spi_widths),
+            help = 'SPI mode used to read the bitstream from flash')
+    bitstream_parser.add_argument('--spi-frequency', metavar = 'MHZ', type = float,
+            help = 'frequency used to read the bitstream from flash')
+    bitstream_parser.add_argument('--output', metavar = 'PATH', required = True,
+            help = 'path of the report')
+    bitstream_parser.add_argument('--json', metavar = 'PATH', required = True,
+            help = 'path of the report in JSON')
+    bitstream_parser.add_argument('bitstream', metavar = 'BITSTREAM',
+            help = 'packed bitstream')
+    bitstream_parser.set_defaults(go = _bitstream_cmd)
+
+    args = parser.parse_args(args[1:])
+    return args.go(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
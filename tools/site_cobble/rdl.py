@@ -16,9 +16,15 @@ RDL_SCRIPT = cobble.env.overrideable_string_key('rdl_script',
 
 RDL_ODIR = cobble.env.overrideable_string_key('rdl_odir')
 
-KEYS = frozenset([RDL_SCRIPT, RDL_ODIR])
+RDL_CACHE_DIR = cobble.env.overrideable_string_key('rdl_cache_dir',
+          help = 'Directory holding elaborated register models, shared by rdl targets')
 
-_ver_keys = frozenset([RDL_SCRIPT.name])
+RDL_FLAGS = cobble.env.appending_string_seq_key('rdl_flags',
+          help = 'Extra flags to pass to the rdl script')
+
+KEYS = frozenset([RDL_SCRIPT, RDL_ODIR, RDL_CACHE_DIR, RDL_FLAGS])
+
+_ver_keys = frozenset([RDL_SCRIPT.name, RDL_CACHE_DIR.name])
 
 
 # Helper function to fix up the case into a bsv-standards compatible
@@ -32,6 +38,7 @@ def rdl(package, name, *,
         deps = [],
         sources = [],
         outputs = [],
+        maps = {},
         local: Delta = {},
         using: Delta = {}):
     
@@ -41,17 +48,27 @@ def rdl(package, name, *,
         # Determine output directory since we need to output some files here.
         out_dir = package.outpath(env)
         output_paths = [str(Path(out_dir) / Path(output)) for output in outputs]
-        symlinks = [package.linkpath(output) for output in outputs]
+        # Outputs of the lower level address maps, generated from the same
+        # elaboration as the top map. These are implicit outputs, as the
+        # script is told which map each of them belongs to through flags.
+        map_outputs = [output for map_name in sorted(maps) for output in maps[map_name]]
+        map_output_paths = [str(Path(out_dir) / Path(output)) for output in map_outputs]
+        symlinks = [package.linkpath(output) for output in outputs + map_outputs]
         p_env = env.derive({
             RDL_ODIR.name:out_dir,
+            RDL_FLAGS.name: [
+                '--map %s=%s' % (map_name, ','.join(
+                    str(Path(out_dir) / Path(output)) for output in maps[map_name]))
+                for map_name in sorted(maps)
+            ],
         })
         product = cobble.target.Product(
             env = p_env,
             inputs = ctx.rewrite_sources(sources), # get absolute path for the sources
-            outputs = output_paths,
+            outputs = (output_paths, map_output_paths),
             rule = 'rdl_script')
         
-        for output, path, link in zip(outputs, output_paths, symlinks):
+        for output, path, link in zip(outputs + map_outputs, output_paths + map_output_paths, symlinks):
             product.expose(path=path, name=str(Path(output).name))
             product.symlink(target=path, source=link)
 
@@ -80,7 +97,7 @@ def rdl(package, name, *,
 
 ninja_rules = {
     'rdl_script': {
-        'command': ' python3 $rdl_script --input $in --output $out',
+        'command': ' python3 $rdl_script --cache-dir $rdl_cache_dir $rdl_flags --input $in --output $out',
         'description': 'making rdl outputs',
     }
 }
@@ -0,0 +1,106 @@
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+# Benchmark of register model generation on synthetic address maps.
+#
+# Generates an address map with the requested number of registers, each of a
+# distinct type with a few fields and grouped into regfiles, and reports the
+# time taken to compile it, to build the register model and to render the BSV
+# and HTML outputs, along with the peak memory used by the model. With
+# --array the regfiles are instead elements of one array of a single regfile
+# type, whose outputs shouldn't grow with the number of elements.
+#
+# Usage: python3 bench.py [--registers 10000 100000] [--array] [--out-dir DIR]
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pathlib import Path
+
+from systemrdl import RDLCompiler, RDLWalker
+
+from exporter import MapExporter
+from listeners import BaseListener
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--registers', nargs="+", type=int, default=[10000, 100000], help='Sizes of the maps to generate')
+parser.add_argument('--per-regfile', type=int, default=64, help='Registers per regfile')
+parser.add_argument('--array', action='store_true', default=False, help='Generate an array of one regfile type')
+parser.add_argument('--out-dir', dest='out_dir', default=None, help='Directory for the generated sources and outputs')
+
+
+def synthetic_array_map(registers: int, per_regfile: int) -> str:
+    lines = ['addrmap bench_map {', '    default regwidth = 8;', '    default sw = rw;', '    default hw = r;', '    regfile {']
+    for r in range(per_regfile):
+        lines.append(f'        reg {{ name = "Register {r}"; '
+                     f'field {{ desc = "a"; }} a[0:0] = 0; '
+                     f'field {{ desc = "b"; }} b[4:2] = 0; '
+                     f'field {{ desc = "c"; }} c[7:6] = 0; }} r{r};')
+    lines.append(f'    }} rf[{max(1, registers // per_regfile)}];')
+    lines.append('};')
+    return '\n'.join(lines) + '\n'
+
+
+def synthetic_map(registers: int, per_regfile: int) -> str:
+    lines = ['addrmap bench_map {', '    default regwidth = 8;', '    default sw = rw;', '    default hw = r;']
+    for rf in range((registers + per_regfile - 1) // per_regfile):
+        lines.append('    regfile {')
+        for r in range(min(per_regfile, registers - rf * per_regfile)):
+            lines.append(f'        reg {{ name = "Register {r}"; '
+                         f'field {{ desc = "a"; }} a[0:0] = 0; '
+                         f'field {{ desc = "b"; }} b[4:2] = 0; '
+                         f'field {{ desc = "c"; }} c[7:6] = 0; }} r{r};')
+        lines.append(f'    }} rf{rf};')
+    lines.append('};')
+    return '\n'.join(lines) + '\n'
+
+
+def run(registers: int, per_regfile: int, out_dir: Path, array: bool):
+    source = out_dir / f'bench_{registers}.rdl'
+    source.write_text((synthetic_array_map if array else synthetic_map)(registers, per_regfile))
+
+    start = time.monotonic()
+    rdlc = RDLCompiler()
+    rdlc.compile_file(str(source))
+    root = rdlc.elaborate()
+    compiled = time.monotonic()
+
+    listener = BaseListener()
+    RDLWalker().walk(root.top, listener)
+    modeled = time.monotonic()
+
+    # Tracing slows allocations down, so the memory used by the model is
+    # measured on a second walk.
+    tracemalloc.start()
+    RDLWalker().walk(root.top, BaseListener())
+    _, model_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    exporting = time.monotonic()
+    MapExporter().export(root.top, [out_dir / f'BenchRegs{registers}.bsv', out_dir / f'bench_{registers}.html'])
+    exported = time.monotonic()
+
+    print(f'{registers:>8} registers: compile {compiled - start:8.2f}s, model {modeled - compiled:6.2f}s '
+          f'({model_peak / 2**20:7.1f} MiB peak), export {exported - exporting:6.2f}s')
+
+
+def main():
+    if args.out_dir is not None:
+        out_dir = Path(args.out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for registers in args.registers:
+            run(registers, args.per_regfile, out_dir, args.array)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            for registers in args.registers:
+                run(registers, args.per_regfile, Path(tmp), args.array)
+
+args = parser.parse_args()
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ from os import PathLike
 
 from typing import TYPE_CHECKING
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from systemrdl.node import RootNode, Node
 from systemrdl import RDLWalker
 
@@ -11,7 +11,7 @@ from models import Register, Field, ReservedField, Memory
 from listeners import BaseListener
 from utils import to_camel_case, to_snake_case
 
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 class TemplatedOutput:
     known_templates = {
@@ -39,17 +39,41 @@ class OutputUtils:
         return filtered[0].full_output_path.stem
 
 
+# Jinja environment shared by every exporter in this process, see
+# get_environment().
+_environment = None
+
+
+def get_environment(bytecode_cache_dir: Optional[PathLike] = None) -> Environment:
+    """
+    Return the Jinja environment, creating it on first use. Templates are
+    loaded lazily, when an output is rendered, and compiled templates are
+    kept in the bytecode cache directory if given, so later runs skip
+    parsing and compiling them.
+    """
+    global _environment
+    if _environment is None:
+        bytecode_cache = None
+        if bytecode_cache_dir is not None:
+            Path(bytecode_cache_dir).mkdir(parents=True, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(str(bytecode_cache_dir))
+        _environment = Environment(
+            loader=FileSystemLoader(Path(__file__).parent / 'templates'),
+            bytecode_cache=bytecode_cache,
+            lstrip_blocks=True,
+            trim_blocks=True)
+        _environment.filters['to_camel_case'] = to_camel_case
+        _environment.filters['to_snake_case'] = to_snake_case
+    return _environment
+
+
 class BaseExporter:
-    def __init__(self, **kwargs):
+    def __init__(self, bytecode_cache_dir: Optional[PathLike] = None, **kwargs):
         # Check for any stray kwargs
         if kwargs:
             raise TypeError(f"got an unexpected keyword argument '{list(kwargs.keys())[0]}")
 
-        # Load jinja templates
-        self.env = Environment(loader=FileSystemLoader(Path(__file__).parent / 'templates'), lstrip_blocks=True, trim_blocks=True)
-        self.env.filters['to_camel_case'] = to_camel_case
-        self.env.filters['to_snake_case'] = to_snake_case
-        self.templates = []
+        self.env = get_environment(bytecode_cache_dir)
         self.outputs = []
 
     def _write_files(self, context):
@@ -62,11 +86,6 @@ class BaseExporter:
 class MapofMapsExporter(BaseExporter):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        # Sort of a hack for now, load our jinja templates into a list
-        self.templates = [
-            self.env.get_template('toplvl_bsv.jinja2'), 
-            self.env.get_template('regmap_html.jinja2'),
-            ]
 
     def export(self, node: Node, output_names: List[PathLike], **kwargs: 'Dict[str, Any]') -> None:
         # Check for any stray kwargs
@@ -110,11 +129,6 @@ class MapofMapsExporter(BaseExporter):
 class MapExporter(BaseExporter):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.templates = [
-            # self.env.get_template('regmap_adoc.jinja2'), 
-            self.env.get_template('regpkg_bsv.jinja2'), 
-            self.env.get_template('regmap_html.jinja2'),
-            ]
 
     def export(self, node: Node, output_names: List[PathLike], **kwargs: 'Dict[str, Any]') -> None:
         """
@@ -135,8 +149,9 @@ class MapExporter(BaseExporter):
         for name in output_names:
             self.outputs.append(TemplatedOutput(name))
 
-        # Walk the model and build a data structure in self.registers
-        addr_map = BaseListener()
+        # Walk the model and build a data structure in self.registers. Offsets
+        # are relative to this map, which need not be the top of the elaboration.
+        addr_map = BaseListener(base_address=node.raw_absolute_address)
         RDLWalker().walk(node, addr_map)
 
          # Inject some needed context into the Jinja templates
@@ -27,6 +27,11 @@
 #   inst_name: <string>,
 #   addr_offset: <integer>
 #   children: <array of objects (registers or other address maps)>
+# ----------------------------
+# Arrays of registers, regfiles, address maps or memories are described once,
+# with addr_offset the offset of the first element and the additional keys:
+#   array_dimensions: <array of integers, the element count of each dimension>
+#   array_stride: <integer, the address stride between elements of the last dimension>
 import json
 
 from os import PathLike
@@ -35,9 +40,12 @@ from systemrdl import RDLCompiler
 from systemrdl.node import RootNode, FieldNode, AddrmapNode, RegfileNode, RegNode, MemNode
 
 
-def convert_to_json(rdlc: RDLCompiler, obj: RootNode, path: Union[str, PathLike]):
-    # Convert entire register model to primitive datatypes (a dict/list tree)
-    json_obj = convert_addrmap_or_regfile(rdlc, obj.top)
+def convert_to_json(rdlc: RDLCompiler, obj: Union[RootNode, AddrmapNode], path: Union[str, PathLike]):
+    # Convert entire register model, or the given address map within it, to
+    # primitive datatypes (a dict/list tree)
+    if isinstance(obj, RootNode):
+        obj = obj.top
+    json_obj = convert_addrmap_or_regfile(rdlc, obj)
 
     # Write to a JSON file
     with open(path, "w") as f:
@@ -65,18 +73,20 @@ def convert_field(rdlc: RDLCompiler, obj: FieldNode) -> dict:
     return json_obj
 
 
-def convert_reg(rdlc: RDLCompiler, obj: RegNode) -> dict:
+def convert_array(obj: Union[AddrmapNode, RegfileNode, RegNode, MemNode], json_obj: dict):
+    # An array is described by its first element, its dimensions and stride
+    # rather than one entry per element, so its size doesn't grow with them.
+    json_obj['addr_offset'] = obj.raw_address_offset
     if obj.is_array:
-        # Use the RDL Compiler message system to print an error
-        # fatal() raises RDLCompileError
-        rdlc.msg.fatal(
-            "JSON export does not support arrays",
-            obj.inst.inst_src_ref
-        )
+        json_obj['array_dimensions'] = list(obj.array_dimensions)
+        json_obj['array_stride'] = obj.array_stride
+
+
+def convert_reg(rdlc: RDLCompiler, obj: RegNode) -> dict:
     json_obj = dict()
     json_obj['type'] = 'reg'
     json_obj['inst_name'] = obj.inst_name
-    json_obj['addr_offset'] = obj.address_offset
+    convert_array(obj, json_obj)
     json_obj['regwidth'] = obj.get_property('regwidth')
     json_obj['min_accesswidth'] = obj.get_property('accesswidth')
 
@@ -92,7 +102,7 @@ def convert_mem(obj: MemNode) -> dict:
     json_obj = dict()
     json_obj['type'] = 'mem'
     json_obj['inst_name'] = obj.inst_name
-    json_obj['addr_offset'] = obj.address_offset
+    convert_array(obj, json_obj)
     json_obj['memwidth'] = obj.get_property('memwidth')
     json_obj['mementries'] = obj.get_property('mementries')
 
@@ -100,12 +110,6 @@ def convert_mem(obj: MemNode) -> dict:
 
 
 def convert_addrmap_or_regfile(rdlc: RDLCompiler, obj: Union[AddrmapNode, RegfileNode]) -> dict:
-    if obj.is_array:
-        rdlc.msg.fatal(
-            "JSON export does not support arrays",
-            obj.inst.inst_src_ref
-        )
-
     json_obj = dict()
     if isinstance(obj, AddrmapNode):
         json_obj['type'] = 'addrmap'
@@ -115,7 +119,7 @@ def convert_addrmap_or_regfile(rdlc: RDLCompiler, obj: Union[AddrmapNode, Regfil
         raise RuntimeError
 
     json_obj['inst_name'] = obj.inst_name
-    json_obj['addr_offset'] = obj.address_offset
+    convert_array(obj, json_obj)
 
     json_obj['children'] = []
     for child in obj.children():
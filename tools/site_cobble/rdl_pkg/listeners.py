@@ -1,6 +1,8 @@
+import sys
+
 from systemrdl import RDLListener, AddrmapNode, RegfileNode, RegNode, FieldNode, MemNode
 
-from models import Register, Field, Memory
+from models import Register, Field, Memory, array_dimensions
 
 # Define a listener that will print out the register model hierarchy
 class MyModelPrintingListener(RDLListener):
@@ -63,33 +65,67 @@ class PreExportListener(RDLListener):
 
 
 class BaseListener(RDLListener):
-    def __init__(self):
-        self.prefix_stack = []
-        self.known_types = []
+    def __init__(self, base_address=0):
+        # Offsets are relative to this address, the address of the map being
+        # exported when it is not the top of the elaboration.
+        self.base_address = base_address
+        # The prefix is a tuple, replaced rather than modified when entering
+        # and leaving a scope, so registers can share it without copying.
+        self.prefix_stack = ()
+        # Whether each address map entered is a map of maps, determined once
+        # on entry so exiting it doesn't scan its children again.
+        self.map_of_maps_stack = []
+        # (count, stride) of the arrays enclosing the current scope. Arrays
+        # are walked once rather than unrolled, so their contents are
+        # described once no matter how many elements there are.
+        self.array_stack = ()
+        self.known_types = set()
         self.cur_reg = None
         self.registers = []
 
+    def _push_prefix(self, name):
+        self.prefix_stack = self.prefix_stack + (sys.intern(name),)
+
+    def _pop_prefix(self):
+        self.prefix_stack = self.prefix_stack[:-1]
+
+    def _push_array(self, node):
+        self.array_stack = self.array_stack + array_dimensions(node)
+
+    def _pop_array(self, node):
+        self.array_stack = self.array_stack[:len(self.array_stack) - len(array_dimensions(node))]
+
     def enter_Addrmap(self, node: AddrmapNode) -> None:
         # print(f"Enter Addrmap: {node.inst_name}")
-        if not self.is_map_of_maps(node):  # skip appending the map of maps prefix
-            self.prefix_stack.append(node.inst_name)
+        map_of_maps = self.is_map_of_maps(node)
+        self.map_of_maps_stack.append(map_of_maps)
+        if not map_of_maps:  # skip appending the map of maps prefix
+            self._push_prefix(node.inst_name)
+        if len(self.map_of_maps_stack) > 1:  # offsets are relative to the first element of the map being exported
+            self._push_array(node)
 
     def exit_Addrmap(self, node: AddrmapNode) -> None:
-        if not self.is_map_of_maps(node):  # skip popping the map of maps prefix
-            self.prefix_stack.pop()
+        if len(self.map_of_maps_stack) > 1:
+            self._pop_array(node)
+        if not self.map_of_maps_stack.pop():  # skip popping the map of maps prefix
+            self._pop_prefix()
 
     def enter_Regfile(self, node: RegfileNode) -> None:
         # print(f"Enter Regfile: {node.inst_name}")
-        self.prefix_stack.append(node.inst_name)
+        self._push_prefix(node.inst_name)
+        self._push_array(node)
 
     def exit_Regfile(self, node: RegfileNode) -> None:
-        self.prefix_stack.pop()
-
-    def enter_Regfile(self, node: RegfileNode) -> None:
-        self.prefix_stack.append(node.inst_name)
+        self._pop_array(node)
+        self._pop_prefix()
 
-    def exit_Regfile(self, node: RegfileNode) -> None:
-        self.prefix_stack.pop()
+    def _is_repeated_type(self, node) -> bool:
+        # 2 cases here:
+        # node.orig_type_name is None, use node.type_name
+        if (node.type_name in self.known_types) or (node.orig_type_name is not None and node.orig_type_name in self.known_types):
+            return True
+        self.known_types.add(node.type_name if node.orig_type_name is None else node.orig_type_name)
+        return False
 
     def enter_Reg(self, node: RegNode) -> None:
         # print(f"orig type name: {node.orig_type_name}")
@@ -97,19 +133,8 @@ class BaseListener(RDLListener):
         # print(f"segment: {node.get_path_segment()}")
         # print(f"Enter reg: {node.inst_name}")
         # print(f"stack: {self.prefix_stack}")
-        # 2 cases here:
-        # node.orig_type_name is None, use node.type_name
-        #
-
-        if (node.type_name in self.known_types) or (node.orig_type_name is not None and node.orig_type_name in self.known_types):
-            repeated_type = True
-        else:
-            if node.orig_type_name is not None:
-                self.known_types.append(node.orig_type_name)
-            else:
-                self.known_types.append(node.type_name)
-            repeated_type = False
-        self.cur_reg = Register.from_node(node, self.prefix_stack, repeated_type)
+        repeated_type = self._is_repeated_type(node)
+        self.cur_reg = Register.from_node(node, self.prefix_stack, repeated_type, self.base_address, self.array_stack)
 
     def exit_Reg(self, node):
         """
@@ -136,15 +161,8 @@ class BaseListener(RDLListener):
         pass
 
     def exit_Mem(self, node) -> None:
-        if (node.type_name in self.known_types) or (node.orig_type_name is not None and node.orig_type_name in self.known_types):
-            repeated_type = True
-        else:
-            if node.orig_type_name is not None:
-                self.known_types.append(node.orig_type_name)
-            else:
-                self.known_types.append(node.type_name)
-            repeated_type = False
-        self.registers.append(Memory.from_node(node, self.prefix_stack, repeated_type))
+        repeated_type = self._is_repeated_type(node)
+        self.registers.append(Memory.from_node(node, self.prefix_stack, repeated_type, self.base_address, self.array_stack))
 
     @staticmethod
     def is_map_of_maps(node):
@@ -0,0 +1,134 @@
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+# Cache of elaborated register models.
+#
+# Compiling and elaborating the RDL sources dominates the runtime of rdl_cli.py,
+# and since top level maps list the RDL files of their lower level maps again,
+# the same sources get compiled by several targets. The elaborated model is
+# pickled into a cache directory, keyed by the content of the input files (in
+# order, as this determines the elaboration) and the versions of
+# systemrdl-compiler and Python, so any target with the same inputs can skip
+# both steps. Files pulled in using `include are not known before compiling, so
+# their content is recorded in the entry and checked when loading it.
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+from os import PathLike
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import systemrdl
+from systemrdl import RDLCompiler
+from systemrdl.node import RootNode
+
+# Walking a deep register model when pickling it can exceed the default
+# recursion limit.
+_pickle_recursion_limit = 10000
+
+
+def cache_key(input_files: List[str]) -> str:
+    h = hashlib.sha256()
+    h.update(f"systemrdl-compiler {systemrdl.__version__}\0".encode('utf-8'))
+    h.update(f"python {sys.version_info[0]}.{sys.version_info[1]}\0".encode('utf-8'))
+    h.update(f"pickle {pickle.HIGHEST_PROTOCOL}\0".encode('utf-8'))
+
+    for infile in input_files:
+        h.update(Path(infile).name.encode('utf-8') + b'\0')
+        h.update(_file_digest(infile))
+
+    return h.hexdigest()
+
+
+def _file_digest(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+def _digests(paths: Iterable[str]) -> Dict[str, bytes]:
+    return {path: _file_digest(path) for path in sorted(paths)}
+
+
+def _unchanged(digests: Dict[str, bytes]) -> bool:
+    try:
+        return all(_file_digest(path) == digest for path, digest in digests.items())
+    except OSError:
+        return False
+
+
+def _load(path: Path) -> Optional[RootNode]:
+    try:
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # A corrupt or incompatible entry is treated as a miss and replaced.
+        print(f"Ignoring cached register model {path}: {e}", file=sys.stderr)
+        return None
+
+    # An entry holds the model and the digests of the files included by the
+    # inputs, which are only valid if none of those changed.
+    if not isinstance(entry, tuple) or len(entry) != 2:
+        return None
+    root, included = entry
+    if not isinstance(root, RootNode) or not _unchanged(included):
+        return None
+    return root
+
+
+def _store(path: Path, root: RootNode, included: Dict[str, bytes]):
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, _pickle_recursion_limit))
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so concurrent builds never observe
+        # a partial entry.
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((root, included), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except Exception as e:
+        # Not being able to cache the model only costs time.
+        print(f"Unable to cache register model: {e}", file=sys.stderr)
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def compile_and_elaborate(input_files: List[str], cache_dir: Optional[PathLike] = None) -> Tuple[RDLCompiler, RootNode]:
+    """
+    Compile and elaborate the given RDL files, in order, or load the result of
+    an earlier elaboration of the same files from the cache directory if
+    given. The compiler is returned as well, as exporters use its message
+    handler to report errors.
+    Raises RDLCompileError if the sources fail to compile.
+    """
+    rdlc = RDLCompiler()
+
+    path = None
+    if cache_dir is not None:
+        key = cache_key(input_files)
+        path = Path(cache_dir) / key[:2] / f"{key}.pickle"
+        root = _load(path)
+        if root is not None:
+            return rdlc, root
+
+    included = set()
+    for infile in input_files:
+        included.update(rdlc.compile_file(infile).included_files)
+    root = rdlc.elaborate()
+
+    if path is not None:
+        _store(path, root, _digests(included))
+
+    return rdlc, root
@@ -1,5 +1,4 @@
-import copy
-from typing import List
+from typing import List, Tuple
 
 from systemrdl import RegNode, FieldNode, MemNode
 
@@ -11,32 +10,68 @@ class DuplicateEnumNameError(Exception):
 
 known_enum_names = set()
 
+# Register widths, in bits, supported by the generated collateral
+SUPPORTED_REGISTER_WIDTHS = (8, 16, 32, 64)
+
+
+def array_dimensions(node) -> Tuple[Tuple[int, int], ...]:
+    """
+    Returns the (count, stride) of each array dimension of the given node,
+    outermost first, or an empty tuple if the node is not an array. The
+    stride of a node is that of its last dimension, the outer dimensions
+    step over all the elements of the dimensions inside them.
+    """
+    if not getattr(node, 'is_array', False):
+        return ()
+    dims = []
+    stride = node.array_stride
+    for count in reversed(node.array_dimensions):
+        dims.append((count, stride))
+        stride *= count
+    return tuple(reversed(dims))
+
 
 class BaseModel:
+    # Maps can have many thousands of registers, so keep instances small.
+    __slots__ = ('prefix', 'repeated_type', 'node', 'width', 'type_name', 'offset', 'array_dims', 'fields', '_max_field_name_chars')
+
     @classmethod
-    def from_node(cls, node: RegNode, prefix_stack, repeated_type=False):
-        return cls(node=node, prefix_stack=prefix_stack, repeated_type=repeated_type)
+    def from_node(cls, node: RegNode, prefix_stack, repeated_type=False, base_address=0, array_stack=()):
+        return cls(node=node, prefix_stack=prefix_stack, repeated_type=repeated_type, base_address=base_address, array_stack=array_stack)
 
     def __init__(self, **kwargs):
-        self.prefix = copy.deepcopy(kwargs.pop('prefix_stack'))
+        # The listener hands out immutable prefixes shared by all registers in
+        # the same scope, so there is no need to copy them.
+        self.prefix = tuple(kwargs.pop('prefix_stack'))
         self.repeated_type = kwargs.pop('repeated_type')
-        self.enum_names = set()
         self.node = kwargs.pop('node')
         self.width = self.node.size * 8  # node.size is bytes, we want bits here
         self.type_name = self.node.type_name if self.node.orig_type_name is None else self.node.orig_type_name
-        # Want offset from owning address map.
-        self.offset = self.node.absolute_address
+        # Want offset from owning address map. Arrays, and anything inside
+        # them, are described once by the offset of their first element.
+        self.offset = self.node.raw_absolute_address - kwargs.pop('base_address', 0)
+        # (count, stride) of the arrays enclosing this register, and of the
+        # register itself, outermost first
+        self.array_dims = tuple(kwargs.pop('array_stack', ())) + array_dimensions(self.node)
         self.fields = []
         self._max_field_name_chars = 0
 
     @property
     def prefixed_name(self):
-        return '_'.join(self.prefix) + '_' + self.node.get_path_segment()
+        return '_'.join(self.prefix) + '_' + self.node.inst_name
 
     @property
     def name(self):
         # We're generating address maps but we can skip the first address map name, but we want the rest of the elaboration
-        return '_'.join(self.prefix[1:]) + '_' + self.node.get_path_segment() if len(self.prefix) > 1 else self.node.get_path_segment()
+        return '_'.join(self.prefix[1:]) + '_' + self.node.inst_name if len(self.prefix) > 1 else self.node.inst_name
+
+    @property
+    def is_array(self):
+        return len(self.array_dims) > 0
+
+    @property
+    def array_counts(self):
+        return [count for count, _ in self.array_dims]
 
     def get_property(self, *args, **kwargs):
         """
@@ -49,6 +84,8 @@ class BaseModel:
         return prop
 
 class Register(BaseModel):
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
@@ -74,12 +111,13 @@ class Register(BaseModel):
         Register elaboration consists of sorting the defined fields by the
         low index of the field. We then loop through the fields and
         determine the largest contiguous gaps in the definitions and creating
-        ReservedFields that fill into these spaces. These are accumulated in
-        a gaps variable, and the gaps and fields are concatenated and
-        re-sorted by low index again at the end.
+        ReservedFields that fill into these spaces. These are inserted in
+        order as the fields are walked, so the result needs no further
+        sorting.
         """
-        if self.width != 8:
-            raise UnsupportedRegisterSizeError(f"We only support 8bit registers at this time. Register {self.name} has a width of {self.width}")
+        if self.width not in SUPPORTED_REGISTER_WIDTHS:
+            supported = ", ".join(str(x) for x in SUPPORTED_REGISTER_WIDTHS)
+            raise UnsupportedRegisterSizeError(f"We only support {supported}bit registers at this time. Register {self.name} has a width of {self.width}")
         
         # sort fields descending by field.low bit
         self.fields.sort(key=lambda x: x.low, reverse=True)
@@ -89,21 +127,37 @@ class Register(BaseModel):
         self._max_field_name_chars = max(self._max_field_name_chars, field_max_name)
         
         # find gaps and fill in with ReservedFields
-        gaps = []
+        fields = []
         expected = self.width - 1
         for field in self.fields:
             if field.high != expected:
-                gaps.append(ReservedField(expected, field.high + 1))
+                fields.append(ReservedField(expected, field.high + 1))
+            fields.append(field)
             expected = field.low - 1
 
-  
         if expected >= 0:
-            gaps.append(ReservedField(expected, 0))
+            fields.append(ReservedField(expected, 0))
 
-        # Combine fields and re-sort, leaving us with a completely specified register
-        self.fields = sorted(self.fields + gaps, key=lambda x: x.low, reverse=True)
+        # A completely specified register, sorted descending by low index
+        self.fields = fields
 
 
+    @property
+    def byte_slices(self):
+        """
+        The register split into its bytes, most significant byte first, as
+        (high, low, [(field, width), ...]) for each byte. Fields spanning
+        several bytes appear in each of them, with the width of their part of
+        the byte.
+        """
+        slices = []
+        for low in range(self.width - 8, -1, -8):
+            high = low + 7
+            parts = [(field, min(field.high, high) - max(field.low, low) + 1)
+                     for field in self.fields if field.low <= high and field.high >= low]
+            slices.append((high, low, parts))
+        return slices
+
     def format_field_name(self, name):
         """
         To nicely generate aligned outputs, it's handy to know the max length
@@ -117,6 +171,8 @@ class Register(BaseModel):
 
 class BaseField:
     """ A base class with common implementations for fields"""
+    __slots__ = ('node', 'name', 'high', 'low', 'desc')
+
     def bitslice_str(self) -> str:
         if self.high == self.low:
             return str(self.low)
@@ -149,6 +205,8 @@ class BaseField:
 
 class Field(BaseField):
     """ A normal, systemRDL-defined field"""
+    __slots__ = ()
+
     @classmethod
     def from_node(cls, node: FieldNode):
         return cls(node=node)
@@ -170,6 +228,8 @@ class Field(BaseField):
 
 class ReservedField(BaseField):
     """ A reserved field, inferred by the gaps in systemRDL definitions"""
+    __slots__ = ()
+
     def __init__(self, high, low):
         self.name = '-'
         self.node = None
@@ -178,5 +238,7 @@ class ReservedField(BaseField):
         self.desc = 'Reserved'
 
 class Memory(BaseModel):
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
\ No newline at end of file
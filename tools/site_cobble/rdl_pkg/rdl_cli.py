@@ -1,31 +1,76 @@
 import sys
 import argparse
 import os
+import time
 from pathlib import Path
 
-from systemrdl import RDLCompiler, RDLCompileError, RDLWalker
+from systemrdl import RDLCompileError, RDLWalker
 from systemrdl.node import FieldNode
 
-from exporter import MapExporter, MapofMapsExporter
+from exporter import MapExporter, MapofMapsExporter, get_environment
 from listeners import PreExportListener, MyModelPrintingListener
 from json_dump import convert_to_json
+from model_cache import compile_and_elaborate
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--input', nargs="+", dest='input_file', help='Explicity input list')
 parser.add_argument('--out-dir', dest='out_dir', default=Path.cwd(), help='Output directory')
 parser.add_argument('--debug', action="store_true", default=False)
 parser.add_argument('--outputs', nargs="+", help="Explicit output list")
+parser.add_argument('--cache-dir', dest='cache_dir', default=None, help='Directory caching elaborated register models')
+parser.add_argument('--map', dest='maps', action='append', default=[], metavar='NAME=OUTPUT[,OUTPUT...]',
+                    help='Outputs for a lower level address map, generated from the same elaboration. May be repeated')
 
 
-def main():
-    rdlc = RDLCompiler()
+def export_map(rdlc, node, output_filenames, map_of_maps=False):
+    output_filenames_no_json = [x for x in output_filenames if '.json' not in str(x)]
+    if map_of_maps:
+        # For a map of maps, we're going to generate:
+        # Address offsets bsv using full address and flattening the naming
+        # an HTML file of everything
+        exporter = MapofMapsExporter()
+    else:
+        # For each standard map, we're going to generate:
+        # Standard bsv package from this base address
+        # an HTML file of this block
+        exporter = MapExporter()
+    # Dump Jinja template-based outputs (filter out .json)
+    if output_filenames_no_json:
+        exporter.export(node, output_filenames_no_json)
+
+    # Dump json output if requested
+    json_files = [x for x in output_filenames if '.json' in str(x)]
+    if len(json_files) == 1:
+        json_name = Path(json_files[0])
+        convert_to_json(rdlc, node, json_name)
+    elif len(json_files) > 1:
+        raise Exception(f'Specified too many .json outputs: {",".join(str(x) for x in json_files)}')
+
 
+def find_map(maps, name):
+    # Maps are named by instance name, or by their full path if the instance
+    # name is ambiguous.
+    found = [x for x in maps if x.get_path() == name]
+    if not found:
+        found = [x for x in maps if x.inst_name == name]
+    if len(found) != 1:
+        known = ", ".join(x.get_path() for x in maps)
+        problem = "is ambiguous" if found else "not found"
+        raise Exception(f'Address map {name} {problem}, known maps: {known}')
+    return found[0]
+
+
+def main():
+    start = time.monotonic()
     try:
-        for infile in args.input_file:
-            rdlc.compile_file(infile)
-        root = rdlc.elaborate()
+        rdlc, root = compile_and_elaborate(args.input_file, args.cache_dir)
     except RDLCompileError:
         sys.exit(1)
+    elaborated = time.monotonic()
+
+    # Set up the Jinja environment shared by the exporters, keeping compiled
+    # templates next to the cached register models.
+    get_environment(Path(args.cache_dir) / 'jinja' if args.cache_dir is not None else None)
 
     if args.debug:
         # Traverse the register model with the printer
@@ -39,30 +84,19 @@ def main():
     RDLWalker().walk(root, pre_export)
 
     output_filenames = [Path(x) for x in args.outputs]
-    output_filenames_no_json = [x for x in output_filenames if '.json' not in str(x)]
-    # For a map of maps, we're going to generate:
-    # Address offsets bsv using full address and flattening the naming
-    # Address offsets json using full address and flattening the naming??
-    # an HTML file of everything
-    if pre_export.is_map_of_maps:
-        # Dump Jinja template-based outputs (filter out .json)
-        exporter = MapofMapsExporter()
-        exporter.export(pre_export.maps[0], output_filenames_no_json)
-    else:
-        # For each standard map, we're going to generate:
-        # Standard bsv package from this base address
-        # Standard json package from this base address
-        # an HTML file of this block
-        exporter = MapExporter()
-        exporter.export(pre_export.maps[0], output_filenames_no_json)
-
-        # Dump json output if requested
-        json_files = [x for x in output_filenames if '.json' in str(x)]
-        if len(json_files) == 1:
-            json_name = Path(json_files[0])
-            convert_to_json(rdlc, root, json_name)
-        elif len(json_files) > 1:
-            raise Exception(f'Specified too many .json outputs: {json_files.join(",")}')
+    export_map(rdlc, pre_export.maps[0], output_filenames, pre_export.is_map_of_maps)
+
+    # Export any lower level maps requested from the same elaboration, rather
+    # than compiling the same sources again for each of them.
+    for map_arg in args.maps:
+        name, _, outputs = map_arg.partition('=')
+        node = find_map(pre_export.maps, name)
+        export_map(rdlc, node, [Path(x) for x in outputs.split(',') if x])
+
+    if args.debug:
+        end = time.monotonic()
+        print(f"elaboration: {elaborated - start:.3f}s, export: {end - elaborated:.3f}s", file=sys.stderr)
+
 
 args = parser.parse_args()
 
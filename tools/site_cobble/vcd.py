@@ -0,0 +1,116 @@
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Minimal streaming reader for Value Change Dump files as written by Bluesim
+and cxxrtl. Only the header is kept in memory; value changes are produced one
+at a time so arbitrarily large dumps can be processed.
+"""
+
+
+class Var(object):
+    """A variable declared in the VCD header."""
+
+    def __init__(self, id_code, scope, name, width, var_type):
+        self.id_code = id_code
+        self.scope = scope
+        self.name = name
+        self.width = width
+        self.var_type = var_type
+
+    @property
+    def path(self):
+        return '.'.join(self.scope + (self.name,))
+
+    def __repr__(self):
+        return f"Var({self.id_code!r}, {self.path!r}, {self.width})"
+
+
+class VcdReader(object):
+    """Read the header of the given (text mode) file upon construction. The
+    value changes can then be streamed using `changes()`.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.timescale = None
+        self.vars = []
+        # Multiple variables may share an id code if they alias the same
+        # signal, hence the list.
+        self.vars_by_id = {}
+        self._read_header()
+
+    def _tokens(self):
+        for line in self.f:
+            for token in line.split():
+                yield token
+
+    def _read_header(self):
+        scope = []
+        tokens = self._tokens()
+
+        def until_end():
+            body = []
+            for token in tokens:
+                if token == '$end':
+                    return body
+                body.append(token)
+            raise ValueError('unexpected end of VCD header')
+
+        for token in tokens:
+            if token == '$scope':
+                _, name = until_end()[:2]
+                scope.append(name)
+            elif token == '$upscope':
+                until_end()
+                scope.pop()
+            elif token == '$var':
+                body = until_end()
+                var_type, width, id_code, name = body[:4]
+                # Bit selects are emitted as a separate token by some writers.
+                if len(body) > 4:
+                    name += ''.join(body[4:])
+                var = Var(id_code, tuple(scope), name, int(width), var_type)
+                self.vars.append(var)
+                self.vars_by_id.setdefault(id_code, []).append(var)
+            elif token == '$timescale':
+                self.timescale = ''.join(until_end())
+            elif token == '$enddefinitions':
+                until_end()
+                return
+            elif token.startswith('$'):
+                until_end()
+
+        raise ValueError('VCD file has no $enddefinitions')
+
+    def changes(self):
+        """Generate (time, id_code, value) tuples for each value change in
+        the file. Values are returned as strings without the 'b'/'r' prefix
+        used for vectors and reals.
+        """
+        time = 0
+        in_comment = False
+
+        for line in self.f:
+            line = line.strip()
+            if not line:
+                continue
+
+            if in_comment:
+                in_comment = not line.endswith('$end')
+                continue
+
+            c = line[0]
+            if c == '#':
+                time = int(line[1:])
+            elif c in '01xXzZ':
+                yield (time, line[1:], line[0])
+            elif c in 'bBrR':
+                value, id_code = line[1:].split()
+                yield (time, id_code, value)
+            elif line.startswith('$comment'):
+                in_comment = not line.endswith('$end')
+            # Other keywords such as $dumpvars, $dumpall and their $end
+            # markers carry no information for us.
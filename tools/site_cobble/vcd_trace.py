@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Convert VCD files into a compact, memory-mappable trace store and query
+them without having to read through the whole text dump every time.
+
+A trace store is a directory holding two files:
+
+- index.json, describing each signal: its width, number of value changes and
+  the offsets of its arrays in the data file.
+- data.bin, holding for each signal a contiguous array of 64 bit little-endian
+  time stamps, followed by an array of fixed size little-endian values and,
+  only for signals which ever take an X or Z value, an equally sized array
+  masking those bits.
+
+Value lookups use a binary search over the time stamps of a single signal, so
+only the pages of the data file touching that signal are ever read.
+
+Example:
+
+    ../tools/site_cobble/vcd_trace.py convert vcd/UARTTests_mkSerializerTest.vcd
+    ../tools/site_cobble/vcd_trace.py value vcd/UARTTests_mkSerializerTest.trace main.top.tx 1000
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import re
+import sys
+
+from vcd import VcdReader
+
+VERSION = 1
+_TIME_SIZE = 8
+
+
+def _parse_value(value, width):
+    """Parse a VCD value string into (value, xmask) integers."""
+    if len(value) == 1 and value in '01':
+        return (int(value), 0)
+
+    value = value.lower()
+    # VCD allows vectors to be written with fewer bits than their width, in
+    # which case they are extended with 0 unless the leftmost bit is X or Z.
+    if len(value) < width and value[0] in 'xz':
+        value = value[0] * (width - len(value)) + value
+
+    bits = value.translate(_VALUE_TABLE)
+    xmask = value.translate(_XMASK_TABLE)
+    return (int(bits, 2), int(xmask, 2))
+
+_VALUE_TABLE = str.maketrans('xz', '00')
+_XMASK_TABLE = str.maketrans('01xz', '0011')
+
+
+def _value_size(width):
+    return max(1, (width + 7) // 8)
+
+
+def convert(vcd_path, store_path):
+    """Convert the given VCD file into a trace store. The VCD file is read
+    twice, once to size the arrays of each signal and once to fill them in,
+    keeping memory use independent of the size of the dump.
+    """
+    # First pass, count the value changes for each signal. Real valued
+    # variables are not supported and skipped.
+    with open(vcd_path, 'r') as f:
+        reader = VcdReader(f)
+        vars_by_id = {
+            id_code: vs for id_code, vs in reader.vars_by_id.items()
+            if vs[0].var_type != 'real'
+        }
+        counts = dict.fromkeys(vars_by_id, 0)
+        has_x = dict.fromkeys(vars_by_id, False)
+        end_time = 0
+
+        for time, id_code, value in reader.changes():
+            if id_code in counts:
+                counts[id_code] += 1
+                if not has_x[id_code] and value.strip('01') != '':
+                    has_x[id_code] = True
+            end_time = time
+
+        variables = [v for v in reader.vars if v.id_code in vars_by_id]
+        timescale = reader.timescale
+
+    # Lay out the arrays of each signal in the data file.
+    offset = 0
+    entries = {}
+    for id_code, vs in vars_by_id.items():
+        width = vs[0].width
+        size = _value_size(width)
+        count = counts[id_code]
+
+        entry = {
+            'width': width,
+            'size': size,
+            'count': count,
+            'times': offset,
+            'values': offset + count * _TIME_SIZE,
+            'xmask': None,
+        }
+        offset += count * (_TIME_SIZE + size)
+        if has_x[id_code]:
+            entry['xmask'] = offset
+            offset += count * size
+
+        entries[id_code] = entry
+
+    os.makedirs(store_path, exist_ok = True)
+    data_path = os.path.join(store_path, 'data.bin')
+
+    # Second pass, fill in the arrays.
+    with open(data_path, 'w+b') as data:
+        data.truncate(offset)
+
+        if offset > 0:
+            with mmap.mmap(data.fileno(), offset) as m, \
+                    open(vcd_path, 'r') as f:
+                cursors = dict.fromkeys(entries, 0)
+
+                for time, id_code, value in VcdReader(f).changes():
+                    entry = entries.get(id_code)
+                    if entry is None:
+                        continue
+
+                    i = cursors[id_code]
+                    cursors[id_code] = i + 1
+
+                    size = entry['size']
+                    v, x = _parse_value(value, entry['width'])
+                    # Values wider than the declared width are truncated.
+                    v &= (1 << (8 * size)) - 1
+
+                    t_offset = entry['times'] + i * _TIME_SIZE
+                    m[t_offset:t_offset + _TIME_SIZE] = \
+                        time.to_bytes(_TIME_SIZE, 'little')
+                    v_offset = entry['values'] + i * size
+                    m[v_offset:v_offset + size] = v.to_bytes(size, 'little')
+                    if entry['xmask'] is not None:
+                        x &= (1 << (8 * size)) - 1
+                        x_offset = entry['xmask'] + i * size
+                        m[x_offset:x_offset + size] = x.to_bytes(size, 'little')
+
+    index = {
+        'version': VERSION,
+        'timescale': timescale,
+        'end_time': end_time,
+        'signals': {var.path: var.id_code for var in variables},
+        'data': entries,
+    }
+    with open(os.path.join(store_path, 'index.json'), 'w') as f:
+        json.dump(index, f)
+
+
+class Signal(object):
+    """A view of the arrays of a single signal in a trace store."""
+
+    def __init__(self, path, entry, m):
+        self.path = path
+        self.width = entry['width']
+        self.size = entry['size']
+        self.count = entry['count']
+        self._m = m
+        self._values = entry['values']
+        self._xmask = entry['xmask']
+
+        if self.count > 0:
+            self.times = memoryview(m)[
+                entry['times']:entry['times'] + self.count * _TIME_SIZE
+            ].cast('Q')
+        else:
+            self.times = []
+
+    def value(self, i):
+        """Return the (value, xmask) integers of change i."""
+        start = i * self.size
+        end = start + self.size
+        v = int.from_bytes(self._m[self._values + start:self._values + end], 'little')
+        if self._xmask is None:
+            return (v, 0)
+        x = int.from_bytes(self._m[self._xmask + start:self._xmask + end], 'little')
+        return (v, x)
+
+    def index_at(self, time):
+        """Return the index of the change in effect at the given time, or None
+        if the signal has no value yet.
+        """
+        i = bisect.bisect_right(self.times, time) - 1
+        return i if i >= 0 else None
+
+    def value_at(self, time):
+        i = self.index_at(time)
+        return self.value(i) if i is not None else None
+
+    def changes(self, start = 0, end = None):
+        """Generate (time, value, xmask) for the changes in [start, end]."""
+        i = bisect.bisect_left(self.times, start)
+        j = bisect.bisect_right(self.times, end) if end is not None else self.count
+        for k in range(i, j):
+            yield (self.times[k],) + self.value(k)
+
+    def format(self, value):
+        if value is None:
+            return '-'
+        v, x = value
+        if x == 0:
+            return str(v) if self.width == 1 else f"'h{v:x}"
+        return ''.join(
+            'x' if (x >> b) & 1 else str((v >> b) & 1)
+            for b in reversed(range(self.width)))
+
+
+class TraceStore(object):
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json'), 'r') as f:
+            self.index = json.load(f)
+
+        if self.index['version'] != VERSION:
+            raise ValueError(f"{path}: unsupported trace store version "
+                f"{self.index['version']}")
+
+        self._data = open(os.path.join(path, 'data.bin'), 'rb')
+        size = os.fstat(self._data.fileno()).st_size
+        self._m = mmap.mmap(self._data.fileno(), size, access = mmap.ACCESS_READ) \
+            if size > 0 else b''
+
+    @property
+    def timescale(self):
+        return self.index['timescale']
+
+    @property
+    def end_time(self):
+        return self.index['end_time']
+
+    @property
+    def signals(self):
+        return sorted(self.index['signals'])
+
+    def match(self, pattern):
+        """Return the names of the signals matching the given regex."""
+        r = re.compile(pattern)
+        return [s for s in self.signals if r.search(s)]
+
+    def signal(self, path):
+        try:
+            id_code = self.index['signals'][path]
+        except KeyError:
+            # Allow unambiguous suffixes to save some typing.
+            candidates = [s for s in self.signals if s.endswith('.' + path)]
+            if len(candidates) != 1:
+                raise KeyError(f"signal {path} " +
+                    ('is ambiguous' if candidates else 'not found'))
+            path = candidates[0]
+            id_code = self.index['signals'][path]
+
+        return Signal(path, self.index['data'][id_code], self._m)
+
+
+def _count_edges(signal, start, end, edge):
+    count = 0
+    # The value before the window, so a change at its start counts as an edge.
+    previous = signal.value_at(start - 1) if start > 0 else None
+    for _, v, x in signal.changes(start, end):
+        if previous is not None and x == 0 and previous[1] == 0:
+            if edge == 'any' and v != previous[0]:
+                count += 1
+            elif edge == 'rising' and previous[0] == 0 and v == 1:
+                count += 1
+            elif edge == 'falling' and previous[0] == 1 and v == 0:
+                count += 1
+        previous = (v, x)
+    return count
+
+
+def _first_difference(a, b):
+    """Return the time of the first difference between two signals, or None
+    if they are identical.
+    """
+    for i in range(min(a.count, b.count)):
+        if a.times[i] != b.times[i] or a.value(i) != b.value(i):
+            return min(a.times[i], b.times[i])
+
+    if a.count != b.count:
+        longer = a if a.count > b.count else b
+        return longer.times[min(a.count, b.count)]
+
+    return None
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description = 'Convert and query VCD trace stores')
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+    p = subparsers.add_parser('convert', help = 'convert a VCD file into a trace store')
+    p.add_argument('vcd', metavar = 'VCD')
+    p.add_argument('store', metavar = 'STORE', nargs = '?',
+            help = 'path of the trace store, defaults to VCD with a .trace extension')
+
+    p = subparsers.add_parser('list', help = 'list the signals in a trace store')
+    p.add_argument('store', metavar = 'STORE')
+    p.add_argument('pattern', metavar = 'REGEX', nargs = '?', default = '')
+
+    p = subparsers.add_parser('value', help = 'print the value of signals at a given time')
+    p.add_argument('store', metavar = 'STORE')
+    p.add_argument('signal', metavar = 'SIGNAL', nargs = '+')
+    p.add_argument('time', metavar = 'TIME', type = int)
+
+    p = subparsers.add_parser('edges', help = 'count the edges of a signal')
+    p.add_argument('store', metavar = 'STORE')
+    p.add_argument('signal', metavar = 'SIGNAL')
+    p.add_argument('--from', dest = 'start', metavar = 'TIME', type = int, default = 0)
+    p.add_argument('--to', dest = 'end', metavar = 'TIME', type = int)
+    p.add_argument('--edge', choices = ['any', 'rising', 'falling'], default = 'any',
+            help = 'type of edge to count, rising/falling apply to 1 bit signals')
+
+    p = subparsers.add_parser('range', help = 'print the changes of signals within a time range')
+    p.add_argument('store', metavar = 'STORE')
+    p.add_argument('signal', metavar = 'SIGNAL', nargs = '+')
+    p.add_argument('--from', dest = 'start', metavar = 'TIME', type = int, default = 0)
+    p.add_argument('--to', dest = 'end', metavar = 'TIME', type = int)
+
+    p = subparsers.add_parser('diff', help = 'compare the signals of two trace stores')
+    p.add_argument('a', metavar = 'STORE')
+    p.add_argument('b', metavar = 'STORE')
+    p.add_argument('pattern', metavar = 'REGEX', nargs = '?', default = '')
+
+    args = parser.parse_args(args[1:])
+
+    try:
+        if args.command == 'convert':
+            store = args.store or os.path.splitext(args.vcd)[0] + '.trace'
+            convert(args.vcd, store)
+            return 0
+
+        if args.command == 'diff':
+            a = TraceStore(args.a)
+            b = TraceStore(args.b)
+            a_signals = set(a.match(args.pattern))
+            b_signals = set(b.match(args.pattern))
+
+            differences = 0
+            for path in sorted(a_signals - b_signals):
+                print(f"- {path}")
+                differences += 1
+            for path in sorted(b_signals - a_signals):
+                print(f"+ {path}")
+                differences += 1
+            for path in sorted(a_signals & b_signals):
+                time = _first_difference(a.signal(path), b.signal(path))
+                if time is not None:
+                    print(f"! {path} differs from time {time}")
+                    differences += 1
+
+            return 0 if differences == 0 else 2
+
+        store = TraceStore(args.store)
+
+        if args.command == 'list':
+            for path in store.match(args.pattern):
+                signal = store.signal(path)
+                print(f"{path}\t{signal.width}\t{signal.count}")
+        elif args.command == 'value':
+            for name in args.signal:
+                signal = store.signal(name)
+                print(f"{signal.path}\t{signal.format(signal.value_at(args.time))}")
+        elif args.command == 'edges':
+            signal = store.signal(args.signal)
+            print(_count_edges(signal, args.start, args.end, args.edge))
+        elif args.command == 'range':
+            signals = [store.signal(name) for name in args.signal]
+            for signal in signals:
+                print(f"{signal.path}\t{signal.format(signal.value_at(args.start))}"
+                    f"\t@{args.start}")
+                for time, v, x in signal.changes(args.start + 1, args.end):
+                    print(f"{signal.path}\t{signal.format((v, x))}\t@{time}")
+    except (KeyError, ValueError, OSError) as e:
+        print(e.args[0] if isinstance(e, KeyError) else e, file = sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -5,12 +5,21 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 
-import string
+import json
 import os.path
+import re
+import string
+import subprocess
+import sys
+import tempfile
 
+import cobble.cmd
 import cobble.env
+import cobble.target
 from cobble.plugin import *
 
+import bench_metrics
+
 
 YOSYS = cobble.env.overrideable_string_key('yosys',
         default = 'yosys',
@@ -24,15 +33,37 @@ FLAGS = cobble.env.appending_string_seq_key('yosys_flags',
 CMDS = cobble.env.appending_string_seq_key('yosys_cmds',
         help = 'Commands used by Yosys for processing the design.',
         readout = lambda cs: ';'.join(cs))
+SYNTH_FLAGS = cobble.env.appending_string_seq_key('yosys_synth_flags',
+        help = 'Extra flags for the synthesis command, available as $synth_flags in yosys_cmds.')
 BACKEND = cobble.env.overrideable_string_key('yosys_backend',
         help = 'Backend used by Yosys to write the output result.')
 
 SCRIPT = cobble.env.overrideable_string_key('yosys_script',
         help = 'Internel key used to pass the path to a script file')
 
-KEYS = frozenset([YOSYS, AWK, FLAGS, CMDS, BACKEND, SCRIPT])
+CACHE = cobble.env.overrideable_string_key('yosys_cache',
+        help = 'Path of the script used to skip Yosys runs if the content of their inputs did not '
+            'change.')
+
+STATS = cobble.env.overrideable_string_key('yosys_stats',
+        help = 'Path of the script used to collect synthesis statistics.')
+
+TIMING = cobble.env.overrideable_string_key('yosys_timing',
+        help = 'Path of the script used to estimate the logic depth of a synthesized design.')
+TIMING_FLAGS = cobble.env.appending_string_seq_key('yosys_timing_flags',
+        help = 'Extra flags to pass to the logic depth estimate, such as the delay per level.')
+
+CXXRTL_PCH = cobble.env.overrideable_string_key('yosys_cxxrtl_pch',
+        help = 'When set, compile the header of a cxxrtl model as a precompiled header.')
+
+KEYS = frozenset([YOSYS, AWK, FLAGS, CMDS, SYNTH_FLAGS, BACKEND, SCRIPT, CACHE, STATS, TIMING,
+    TIMING_FLAGS, CXXRTL_PCH])
 _script_keys = frozenset([AWK.name, CMDS.name])
 _design_keys = frozenset([YOSYS.name, FLAGS.name, BACKEND.name, SCRIPT.name])
+_pch_keys = frozenset(['cxx', 'cxx_flags'])
+_stats_keys = frozenset([STATS.name])
+_timing_keys = frozenset([TIMING.name, TIMING_FLAGS.name])
+_cached_keys = frozenset([YOSYS.name, FLAGS.name, CACHE.name, SCRIPT.name])
 
 
 @target_def
@@ -40,11 +71,14 @@ def yosys_design(package, name, *,
         top_module,
         deps = [],
         sources = [],
+        max_logic_levels = None,
         local: Delta = {},
         using: Delta = {}):
     # Free up name
     _using = using
 
+    timing_flags = _max_logic_levels_flags(max_logic_levels)
+
     def mkusing(ctx):
         rewritten_sources = ctx.rewrite_sources(sources)
         read_cmds = _read_sources(rewritten_sources)
@@ -52,9 +86,7 @@ def yosys_design(package, name, *,
         # Yosys commands effectively represent another layer of variables and indirection which
         # needs to be resolved before a script can be written out using a Ninja rule. We want to
         # intercept and rewrite any commands here in order to do this.
-        cmd_vars = {
-            'top_module': top_module,
-        }
+        cmd_vars = _cmd_vars(ctx.env, top_module)
 
         cmds = [
             string.Template(cmd).substitute(cmd_vars)
@@ -76,7 +108,13 @@ def yosys_design(package, name, *,
 
         # With a Yosys script in hand, determine the resulting product.
 
-        env = ctx.env.subset(_design_keys).derive({
+        # The precompiled header is placed next to the model header and has to match the flags of
+        # its dependants, so make the output directory depend on these flags as well.
+        design_keys = _design_keys
+        if CXXRTL_PCH.name in ctx.env:
+            design_keys = design_keys | _pch_keys | {CXXRTL_PCH.name}
+
+        env = ctx.env.subset(design_keys).derive({
             SCRIPT.name: script_path,
         })
         backend = ctx.env[BACKEND.name]
@@ -91,46 +129,87 @@ def yosys_design(package, name, *,
         if backend.startswith('cxxrtl') and '-header' in backend:
             implicit_outputs.append(package.outpath(env, '%s.h' % name))
 
+        # Statistics of the design as written by `stat -json` and the log, which includes the
+        # time spent in each pass.
+        stat_path = outputs[0] + '.stat.json'
+        log_path = outputs[0] + '.log'
+
         design = cobble.target.Product(
             env = env,
             inputs = rewritten_sources,
-            outputs = (outputs, implicit_outputs),
+            outputs = (outputs, implicit_outputs + [stat_path, log_path]),
             implicit = [script_path],
             rule = 'yosys_process_design')
 
         # Expose the outputs.
         design.expose(name = os.path.basename(outputs[0]), path = outputs[0])
-        for path in design.implicit_outputs:
+        for path in implicit_outputs:
             design.expose(name = os.path.basename(path), path = path)
 
+        stats_env = ctx.env.subset_require(_stats_keys)
+        stats_path = package.outpath(env, name + '.stats.json')
+        stats = cobble.target.Product(
+            env = stats_env,
+            inputs = outputs,
+            outputs = [stats_path],
+            implicit = [stat_path, log_path],
+            rule = 'yosys_design_stats')
+        stats.expose(name = 'stats', path = stats_path)
+
+        products = [script, design, stats]
+
+        if backend_cmd == 'json':
+            products.extend(_timing_estimate(ctx, outputs[0], timing_flags))
+
         # Extend the environment if a cxxrtl model was generated so it or its header file can be
         # included by a dependants.
         if backend.startswith('cxxrtl'):
+            include_flags = [
+                # Required for the generated .cc file to be able to include its .h file.
+                '-I%s' % package.project.build_dir,
+                # Required to have dependants include either the .h or
+                # .cc file.
+                #
+                # Note: it is important to use `Project.outpath(..)`
+                # here because this path changes depending on whether or
+                # not the project is the root or a subproject.
+                '-I%s' % package.project.outpath(env, ('')),
+            ]
+
+            # Compiling the model header, and with it the cxxrtl runtime headers, only once
+            # removes most of the parsing from the generated .cc file and any test bench which
+            # includes the header before any other code. The compiler picks up the .gch file
+            # placed next to the header automatically and silently falls back to the header if
+            # the flags used to build it do not match.
+            pch_outputs = []
+            if CXXRTL_PCH.name in ctx.env and implicit_outputs:
+                header = implicit_outputs[0]
+                pch_outputs = [header + '.gch']
+                pch = cobble.target.Product(
+                    env = ctx.env.subset_require(_pch_keys).derive({
+                        'cxx_flags': include_flags,
+                    }),
+                    inputs = [header],
+                    outputs = pch_outputs,
+                    rule = 'yosys_cxxrtl_pch')
+                pch.expose(name = os.path.basename(pch_outputs[0]), path = pch_outputs[0])
+                products.append(pch)
+
             using = (
                 _using,
                 cobble.env.prepare_delta({
                     # Add the necessary include paths.
-                    'cxx_flags': [
-                        # Required for the generated .cc file to be able to include its .h file.
-                        '-I%s' % package.project.build_dir,
-                        # Required to have dependants include either the .h or
-                        # .cc file.
-                        #
-                        # Note: it is important to use `Project.outpath(..)`
-                        # here because this path changes depending on whether or
-                        # not the project is the root or a subproject.
-                        '-I%s' % package.project.outpath(env, ('')),
-                    ],
+                    'cxx_flags': include_flags,
                     # Anything using the generated .h or .cc file will want to include them. This
-                    # forces the generation of these files to happen independent of the order in
-                    # which the C files may be compiled.
-                    '__order_only__': outputs + implicit_outputs,
+                    # forces the generation of these files (and the precompiled header if enabled)
+                    # to happen independent of the order in which the C files may be compiled.
+                    '__order_only__': outputs + implicit_outputs + pch_outputs,
                 }),
             )
         else:
             using = _using
 
-        return (using, [script, design])
+        return (using, products)
 
     return cobble.target.Target(
         package = package,
@@ -140,6 +219,169 @@ def yosys_design(package, name, *,
         local = local,
     )
 
+def _max_logic_levels_flags(max_logic_levels):
+    # The limit on logic levels is either a single value applying to all clocks, or a dict of
+    # clock name (matched as a substring) to value.
+    if max_logic_levels is None:
+        return []
+    elif isinstance(max_logic_levels, dict):
+        return [
+            '--max-levels %s=%s' % (k, v) for k, v in sorted(max_logic_levels.items())
+        ]
+    else:
+        return ['--max-levels %s' % max_logic_levels]
+
+def _timing_estimate(ctx, netlist, timing_flags):
+    # Estimate the logic depth of netlists, which are likely to be placed and routed. This fails
+    # the build if the design exceeds `max_logic_levels`, well before place and route would find
+    # the design does not meet timing. The estimate is written next to the netlist, allowing place
+    # and route to depend on it.
+    if TIMING.name not in ctx.env:
+        return []
+
+    timing_env = ctx.env.subset_require(_timing_keys).derive({
+        TIMING_FLAGS.name: timing_flags,
+    })
+    timing_path = netlist + '.timing.json'
+    timing = cobble.target.Product(
+        env = timing_env,
+        inputs = [netlist],
+        outputs = [timing_path],
+        rule = 'yosys_timing_estimate')
+    timing.expose(name = 'timing', path = timing_path)
+    return [timing]
+
+@target_def
+def yosys_hierarchical_design(package, name, *,
+        top_module,
+        blocks = {},
+        libraries = [],
+        deps = [],
+        sources = [],
+        max_logic_levels = None,
+        local: Delta = {},
+        using: Delta = {}):
+    # Synthesize a design one block at a time. Each block, given as a mapping of module name to the
+    # Verilog source generated for it by bsc, is synthesized and technology mapped on its own. The
+    # top module is then synthesized with the blocks as black boxes, after which the netlists are
+    # stitched together. Synthesis of a block or the top module is skipped if the content of its
+    # inputs did not change, so changing one block only re-synthesizes that block.
+    #
+    # Any `libraries`, such as the Bluespec Verilog primitives, are read in each step. As blocks
+    # are synthesized in isolation, no optimization happens across block boundaries.
+    #
+    # As with `yosys_design`, the logic depth of a JSON netlist is estimated after stitching and
+    # checked against `max_logic_levels`.
+    timing_flags = _max_logic_levels_flags(max_logic_levels)
+
+    def mkusing(ctx):
+        rewritten_sources = ctx.rewrite_sources(sources)
+        rewritten_libraries = ctx.rewrite_sources(libraries)
+        rewritten_blocks = {
+            module: ctx.rewrite_sources([source])[0]
+            for module, source in blocks.items()
+        }
+
+        library_cmds = _read_sources(rewritten_libraries)
+
+        def synth_cmds(module):
+            return [
+                string.Template(cmd).substitute(_cmd_vars(ctx.env, module))
+                for cmd
+                in ctx.env[CMDS.name].split(';')
+            ]
+
+        def script(output_name, cmds):
+            script_env = ctx.env.subset_require(_script_keys).without([CMDS.name]).derive({
+                CMDS.name: cmds,
+            })
+            script_path = package.outpath(script_env, output_name + '.ys')
+            return (script_path, cobble.target.Product(
+                env = script_env,
+                outputs = [script_path],
+                rule = 'yosys_generate_script'))
+
+        def cached_synth(output_name, inputs, cmds):
+            script_path, script_product = script(output_name, cmds)
+            env = ctx.env.subset_require(_cached_keys - {SCRIPT.name}).derive({
+                SCRIPT.name: script_path,
+            })
+            output = package.outpath(env, output_name + '.il')
+            synth = cobble.target.Product(
+                env = env,
+                inputs = inputs,
+                outputs = [output],
+                implicit = [script_path],
+                rule = 'yosys_cached_synth')
+            return (output, [script_product, synth])
+
+        products = []
+
+        # Synthesize each of the blocks.
+        block_netlists = []
+        for module, source in sorted(rewritten_blocks.items()):
+            netlist, ps = cached_synth(
+                '%s.%s' % (name, module),
+                rewritten_libraries + [source],
+                library_cmds + _read_sources([source]) + synth_cmds(module))
+            block_netlists.append(netlist)
+            products.extend(ps)
+
+        # Synthesize the top module, reading only the interfaces of the blocks.
+        top_netlist, ps = cached_synth(
+            '%s.%s' % (name, top_module),
+            rewritten_libraries + rewritten_sources + sorted(rewritten_blocks.values()),
+            library_cmds +
+                _read_sources(rewritten_sources) +
+                ['read_verilog -lib %s' % path for path in sorted(rewritten_blocks.values())] +
+                synth_cmds(top_module))
+        products.extend(ps)
+
+        # Replace the black boxes with the block netlists and write the result using the backend.
+        script_path, script_product = script(name, [
+                'read_rtlil %s' % top_netlist,
+            ] + [
+                'read_rtlil -overwrite %s' % netlist for netlist in block_netlists
+            ] + [
+                'hierarchy -top %s' % top_module,
+            ])
+
+        env = ctx.env.subset(_design_keys).derive({
+            SCRIPT.name: script_path,
+        })
+        backend_cmd = ctx.env[BACKEND.name].split()[0]
+        ext = _backend_file_type_map.get(backend_cmd, backend_cmd)
+        output = package.outpath(env, '%s.%s' % (name, ext))
+
+        design = cobble.target.Product(
+            env = env,
+            inputs = [top_netlist] + block_netlists,
+            outputs = ([output], [output + '.stat.json', output + '.log']),
+            implicit = [script_path],
+            rule = 'yosys_process_design')
+        design.expose(name = os.path.basename(output), path = output)
+        products.extend([script_product, design])
+
+        if backend_cmd == 'json':
+            products.extend(_timing_estimate(ctx, output, timing_flags))
+
+        return (using, products)
+
+    return cobble.target.Target(
+        package = package,
+        name = name,
+        using_and_products = mkusing,
+        deps = deps,
+        local = local,
+    )
+
+def _cmd_vars(env, top_module):
+    # Variables available to Yosys commands.
+    return {
+        'top_module': top_module,
+        'synth_flags': env[SYNTH_FLAGS.name] if SYNTH_FLAGS.name in env else '',
+    }
+
 _read_cmd_file_type_map = {
     '.v': ['read_verilog'],
     '.sv': ['read_verilog', '-sv'],
@@ -157,6 +399,298 @@ def _read_sources(sources):
     return read_cmds
 
 
+_stat_fields = ['cells', 'luts', 'ffs', 'memories', 'memory_bits']
+
+def _diff_stats(previous, current, show_all):
+    """Print the differences in module statistics and runtime between two sets of design
+    statistics, returning the number of lines printed.
+    """
+    lines = 0
+
+    for ident in sorted(set(previous) | set(current)):
+        if ident not in previous or ident not in current:
+            print(f"{ident}: {'added' if ident in current else 'removed'}")
+            lines += 1
+            continue
+
+        before, after = previous[ident], current[ident]
+        rows = []
+
+        modules = set(before['modules']) | set(after['modules'])
+        for module in sorted(modules):
+            b = before['modules'].get(module, {})
+            a = after['modules'].get(module, {})
+            for field in _stat_fields:
+                old, new = b.get(field, 0), a.get(field, 0)
+                if old != new or show_all:
+                    rows.append((f"{module}.{field}", old, new))
+
+        old_cpu, new_cpu = before.get('cpu_seconds'), after.get('cpu_seconds')
+        if old_cpu is not None and new_cpu is not None and \
+                (show_all or abs(new_cpu - old_cpu) >= 0.01 * max(old_cpu, 1)):
+            rows.append(('cpu_seconds', old_cpu, new_cpu))
+
+        # Yosys only reports the runtime of each pass in whole seconds, which is zero for all but
+        # the slowest passes of large designs. Compare the share of the runtime of each pass
+        # instead, which together with the total CPU time above shows which passes slowed down.
+        for name in sorted(set(before['passes']) | set(after['passes'])):
+            old = before['passes'].get(name, {}).get('percent', 0)
+            new = after['passes'].get(name, {}).get('percent', 0)
+            if old != new or show_all:
+                rows.append((f"pass {name} percent", old, new))
+
+        if rows:
+            print(ident)
+            for name, old, new in rows:
+                delta = new - old
+                print(f"  {name:<48} {old:>10} {new:>10} {delta:>+10.6g}")
+            lines += len(rows) + 1
+
+    return lines
+
+@cmd
+def yosys_stats(subparsers):
+    """Build the statistics of Yosys designs, optionally saving them or comparing them against
+    statistics saved from an earlier build. This shows which modules grew or shrunk and which
+    synthesis passes slowed down as the result of a change.
+    """
+
+    def cmd(project, args):
+        query_str = args.query
+        if not query_str.endswith('#stats'):
+            query_str += '.*#stats'
+
+        try:
+            results = cobble.cmd.query_products_and_build(
+                project,
+                re.compile(query_str),
+                jobs=getattr(args, 'jobs', None),
+                loadavg=getattr(args, 'loadavg', None),
+                verbose=args.verbose)
+
+            if len(results) == 0:
+                return 1
+        except cobble.target.EvaluationError as e:
+            cobble.target.print_evaluation_error(e)
+            return 1
+        except subprocess.CalledProcessError:
+            return 1
+
+        current = {}
+        for ident, output in results:
+            with open(output.file_path, 'r') as f:
+                current[ident.split('#')[0]] = json.load(f)
+
+        if args.compare is not None:
+            with open(args.compare, 'r') as f:
+                previous = json.load(f)
+            if _diff_stats(previous, current, args.all) == 0:
+                print('No differences')
+        else:
+            for ident, stats in sorted(current.items()):
+                design = stats['design']
+                print(f"{ident}: " + ', '.join(
+                    f"{design.get(field, 0)} {field}" for field in _stat_fields) +
+                    (f", {stats['cpu_seconds']:.2f}s CPU"
+                        if stats.get('cpu_seconds') is not None else ''))
+
+        if args.save is not None:
+            with open(args.save, 'w') as f:
+                json.dump(current, f, indent=4, sort_keys=True)
+
+        return 0
+
+    parser = subparsers.add_parser('yosys_stats',
+            help = 'show or compare synthesis statistics of Yosys designs')
+    parser.add_argument('-j', '--jobs',
+            help = 'run N build jobs in parallel',
+            type = int,
+            metavar = 'N',
+            dest = 'jobs')
+    parser.add_argument('-l', '--loadavg',
+            help = "don't start new build jobs if loadavg > N",
+            type = float,
+            metavar = 'N',
+            dest = 'loadavg')
+    parser.add_argument('-v', '--verbose',
+            help = 'verbose output: print output while building',
+            action = 'store_true',
+            dest = 'verbose')
+    parser.add_argument('--save',
+            help = 'save the statistics of this build to PATH',
+            metavar = 'PATH',
+            dest = 'save')
+    parser.add_argument('--compare',
+            help = 'compare against statistics saved to PATH by an earlier build',
+            metavar = 'PATH',
+            dest = 'compare')
+    parser.add_argument('--all',
+            help = 'show all statistics when comparing, not only those which changed',
+            action = 'store_true',
+            default = False,
+            dest = 'all')
+    parser.add_argument('query',
+            help = 'Query of designs to show statistics for',
+            nargs = '?',
+            default = '.*')
+    parser.set_defaults(go = cmd)
+
+    return parser
+
+def _run_cxxrtl_bench(path, frames, vcd_path = None):
+    """Run the given benchmark binary, returning the name and values of the
+    METRIC line it printed, or None if it failed.
+    """
+    cmd = [path, '--frames', str(frames)]
+    if vcd_path is not None:
+        cmd += ['--vcd', vcd_path]
+
+    proc = subprocess.run(cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        encoding='utf-8')
+
+    metrics = bench_metrics.parse_metrics(proc.stdout.splitlines())
+    if proc.returncode == 0 and len(metrics) == 1:
+        return next(iter(metrics.items()))
+
+    print(proc.stdout, file=sys.stderr, end='')
+    return None
+
+@cmd
+def cxxrtl_bench(subparsers):
+    """The cxxrtl benchmark builds simulation throughput benchmarks in each of
+    the cxxrtl optimization/debug level environments and runs them with and
+    without writing a VCD file, reporting simulated cycles and frames per
+    second. Results are named after the metric reported by the benchmark and
+    the environment it was built in, i.e. the suffix of the target following
+    `_cxxrtl_bench_`, and can be compared against a stored baseline to detect
+    regressions.
+    """
+
+    def cmd(project, args):
+        try:
+            results = cobble.cmd.query_products_and_build(
+                project,
+                re.compile(args.query),
+                jobs=getattr(args, 'jobs', None),
+                loadavg=getattr(args, 'loadavg', None),
+                verbose=args.verbose)
+
+            if len(results) == 0:
+                return 1
+        except cobble.target.EvaluationError as e:
+            cobble.target.print_evaluation_error(e)
+            return 1
+        except subprocess.CalledProcessError:
+            return 1
+
+        failed = False
+        metrics = {}
+
+        with tempfile.TemporaryDirectory() as vcd_dir:
+            for ident, output in sorted(results, key = lambda r: r[0]):
+                target = ident.split(':')[1].split('#')[0]
+                variant = target.rpartition('_cxxrtl_bench_')[2]
+
+                for vcd in (False, True):
+                    vcd_path = os.path.join(vcd_dir, target + '.vcd') \
+                        if vcd else None
+
+                    runs = []
+                    for _ in range(args.runs):
+                        result = _run_cxxrtl_bench(
+                            output.file_path,
+                            args.frames,
+                            vcd_path)
+                        if result is None:
+                            break
+                        runs.append(result)
+
+                    if len(runs) != args.runs or \
+                            len(set(metric for metric, _ in runs)) != 1:
+                        print(f"{ident}{' (vcd)' if vcd else ''} FAIL",
+                            file=sys.stderr)
+                        failed = True
+                        continue
+
+                    name = f"{runs[0][0]}_{variant}"
+                    if name in metrics:
+                        print(f"{ident}: duplicate metric {name}", file=sys.stderr)
+                        failed = True
+
+                    # Use the fastest of the runs, as this is the least
+                    # disturbed by other activity on the machine.
+                    best = min((values for _, values in runs),
+                        key = lambda v: v['elapsed_ns'])
+                    seconds = best['elapsed_ns'] / 1e9
+                    metrics[name] = {
+                        'cycles': best['cycles'],
+                        'frames': best['frames'],
+                        'seconds': seconds,
+                        'cycles_per_second': best['cycles'] / seconds,
+                        'frames_per_second': best['frames'] / seconds,
+                    }
+
+        baseline = bench_metrics.load_baseline(args.baseline)
+
+        # Report and compare against the baseline. Throughput regresses if it
+        # drops by more than the threshold.
+        rows, regressions = bench_metrics.compare(
+            metrics,
+            baseline,
+            'cycles_per_second',
+            args.threshold,
+            higher_is_better = True)
+
+        name_width = max([len(n) for n in metrics] + [9])
+        print(f"{'Benchmark':<{name_width}} {'Cycles/s':>14} {'Frames/s':>10} "
+            f"{'Baseline':>14} {'Change':>9}")
+        for name, previous, current, change, status in rows:
+            cycles_str = f"{current['cycles_per_second']:>14.0f}" \
+                if current else f"{'-':>14}"
+            frames_str = f"{current['frames_per_second']:>10.2f}" \
+                if current else f"{'-':>10}"
+            previous_str = f"{previous:>14.0f}" \
+                if previous is not None else f"{'-':>14}"
+            change_str = f"{change:+8.2f}%" if change is not None else f"{'':>9}"
+
+            print(f"{name:<{name_width}} {cycles_str} {frames_str} "
+                f"{previous_str} {change_str} {status}")
+
+        if not bench_metrics.write_results(args, baseline, metrics):
+            return 1
+        if args.update_baseline:
+            return 0 if not failed else 2
+
+        return (0 if not failed and regressions == 0 else 2)
+
+    parser = subparsers.add_parser('cxxrtl_bench',
+            help = 'build and run cxxrtl simulation throughput benchmarks')
+    bench_metrics.add_arguments(parser,
+            threshold_help = 'default allowed drop in cycles per second, in percent',
+            threshold_default = 10.0)
+    parser.add_argument('--frames',
+            help = 'number of frames to simulate in each run',
+            type = int,
+            default = 100,
+            metavar = 'N',
+            dest = 'frames')
+    parser.add_argument('--runs',
+            help = 'run each benchmark N times, reporting the fastest run',
+            type = bench_metrics.positive_int,
+            default = 3,
+            metavar = 'N',
+            dest = 'runs')
+    parser.add_argument('query',
+            help = 'Query of benchmarks to build and run',
+            nargs = '?',
+            default = '.*_cxxrtl_bench_.*')
+    parser.set_defaults(go = cmd)
+
+    return parser
+
+
 ninja_rules = {
     'yosys_generate_script': {
         'command': '$yosys_awk \'$$1=$$1\' RS=\';\' $out.rsp > $out',
@@ -164,8 +698,30 @@ ninja_rules = {
         'rspfile': '$out.rsp',
         'rspfile_content': '$yosys_cmds',
     },
+    'yosys_cached_synth': {
+        'command': '$yosys_cache $out $yosys_script $in -- '
+            '$yosys $yosys_flags -q -L $out.log -s $yosys_script -o $out',
+        'description': 'YOSYS $out',
+        # The output is left untouched if synthesis was skipped.
+        'restat': '1',
+    },
     'yosys_process_design': {
-        'command': '$yosys $yosys_flags -q -L $out.log -s $yosys_script -b "$yosys_backend" -o $out',
+        'command': '$yosys $yosys_flags -q -L $out.log -s $yosys_script '
+            '-p "tee -q -o $out.stat.json stat -json" -b "$yosys_backend" -o $out',
         'description': 'YOSYS $yosys_script',
-    }
+    },
+    'yosys_design_stats': {
+        'command': '$yosys_stats --stat $in.stat.json --log $in.log --json $out',
+        'description': 'STATS $out',
+    },
+    'yosys_timing_estimate': {
+        'command': '$yosys_timing $yosys_timing_flags --json $out $in',
+        'description': 'TIMING $out',
+    },
+    'yosys_cxxrtl_pch': {
+        'command': '$cxx $cxx_flags -x c++-header -MD -MF $out.d -c $in -o $out',
+        'description': 'PCH $in',
+        'depfile': '$out.d',
+        'deps': 'gcc',
+    },
 }
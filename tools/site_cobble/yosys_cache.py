@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Run a Yosys command only if the content of its inputs changed.
+
+Bluespec regenerates the Verilog of every module in a package whenever the
+package is compiled, touching files whose content did not change. This wrapper
+computes a key over the command, the Yosys script and the content of the
+inputs, ignoring the time stamp bsc writes into the header of generated
+Verilog. If the key matches the one recorded for the existing output, the
+command is skipped and the output left untouched, allowing Ninja (using
+`restat`) to prune everything downstream of it.
+
+Usage: yosys_cache.py OUTPUT SCRIPT [INPUT ...] -- COMMAND ...
+"""
+
+import hashlib
+import os
+import re
+import subprocess
+import sys
+
+# bsc writes the date and time of generation into the header of each module.
+_bsc_timestamp_re = re.compile(rb'^//\s+On \w{3} \w{3}\s+\d+ .*$', re.MULTILINE)
+
+
+def content_key(command, paths):
+    h = hashlib.sha256()
+    h.update('\0'.join(command).encode('utf-8'))
+
+    for path in paths:
+        with open(path, 'rb') as f:
+            content = f.read()
+        if path.endswith('.v'):
+            content = _bsc_timestamp_re.sub(b'', content)
+
+        h.update(b'\0' + path.encode('utf-8') + b'\0')
+        h.update(hashlib.sha256(content).digest())
+
+    return h.hexdigest()
+
+
+def main(args):
+    try:
+        split = args.index('--')
+    except ValueError:
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        return 1
+
+    output, *paths = args[1:split]
+    command = args[split + 1:]
+    if not paths or not command:
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        return 1
+
+    key_path = output + '.key'
+    key = content_key(command, paths)
+
+    if os.path.exists(output) and os.path.exists(key_path):
+        with open(key_path, 'r') as f:
+            if f.read().strip() == key:
+                return 0
+
+    # Remove the stale key first, so a failed command is retried on the next
+    # build.
+    if os.path.exists(key_path):
+        os.remove(key_path)
+
+    returncode = subprocess.call(command)
+    if returncode == 0:
+        with open(key_path, 'w') as f:
+            print(key, file=f)
+
+    return returncode
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
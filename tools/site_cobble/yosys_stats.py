@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Collect synthesis statistics of a Yosys design.
+
+Combines the output of `stat -json`, run at the end of a design script, with
+the pass runtimes Yosys writes to the footer of its log into a single JSON
+file. For each module the number of cells by type and the number of LUTs, FFs
+and memories are recorded, along with the calls and share of the runtime of
+each pass. Use `cobble yosys_stats` to compare these between builds.
+"""
+
+import argparse
+import json
+import re
+import sys
+
+# Yosys writes a summary of the time spent in each pass at exit, e.g.
+# `Time spent: 53% 1x abc (0 sec), 21% 23x opt_expr (0 sec), ...`.
+_time_spent_re = re.compile(r'(\d+)% (\d+)x (\S+) \((\d+) sec\)')
+
+# Cell types counted as LUTs, FFs and memories, across generic cells and the
+# cells of the supported FPGA families.
+_lut_re = re.compile(r'^(\$lut|\$_LUT.*|LUT\d|SB_LUT4|TRELLIS_COMB)$')
+_ff_re = re.compile(r'^(\$.*dff.*|\$_.*DFF.*|\$_.*LATCH.*|\$.*latch.*|TRELLIS_FF|SB_DFF.*)$')
+_memory_re = re.compile(r'^(\$mem.*|DP16KD|PDPW16KD|TRELLIS_DPR16X4|SB_RAM40_4K.*|SB_SPRAM256KA)$')
+
+
+def summarize_module(stat):
+    cell_types = stat.get('num_cells_by_type', {})
+
+    def count(r):
+        return sum(n for t, n in cell_types.items() if r.match(t))
+
+    return {
+        'cells': stat.get('num_cells', 0),
+        'wires': stat.get('num_wires', 0),
+        'wire_bits': stat.get('num_wire_bits', 0),
+        'luts': count(_lut_re),
+        'ffs': count(_ff_re),
+        'memories': count(_memory_re) + stat.get('num_memories', 0),
+        'memory_bits': stat.get('num_memory_bits', 0),
+        'cell_types': cell_types,
+    }
+
+
+def parse_passes(lines):
+    passes = {}
+    for line in lines:
+        if 'Time spent:' not in line:
+            continue
+        for match in _time_spent_re.finditer(line):
+            passes[match.group(3)] = {
+                'percent': int(match.group(1)),
+                'calls': int(match.group(2)),
+                'seconds': int(match.group(4)),
+            }
+    return passes
+
+
+_cpu_re = re.compile(r'CPU: user ([\d.]+)s system ([\d.]+)s')
+
+
+def parse_cpu_time(lines):
+    seconds = None
+    for line in lines:
+        match = _cpu_re.search(line)
+        if match:
+            seconds = float(match.group(1)) + float(match.group(2))
+    return seconds
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description = 'Collect synthesis statistics of a Yosys design')
+
+    parser.add_argument('--stat', metavar = 'PATH', required = True,
+            type = argparse.FileType('r'),
+            help = 'output of `stat -json`')
+    parser.add_argument('--log', metavar = 'PATH', required = True,
+            type = argparse.FileType('r'),
+            help = 'log written by Yosys')
+    parser.add_argument('--json', metavar = 'PATH', required = True,
+            help = 'path of the collected statistics')
+
+    args = parser.parse_args(args[1:])
+
+    stat = json.load(args.stat)
+    log = args.log.read().splitlines()
+
+    stats = {
+        'modules': {
+            name: summarize_module(module)
+            for name, module in stat.get('modules', {}).items()
+        },
+        'design': summarize_module(stat.get('design', {})),
+        'passes': parse_passes(log),
+        'cpu_seconds': parse_cpu_time(log),
+    }
+
+    with open(args.json, 'w') as f:
+        json.dump(stats, f, indent = 4, sort_keys = True)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Oxide Computer Company
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Estimate the logic depth of a synthesized design before place and route.
+
+Walks the combinational logic of each module in a Yosys JSON netlist and finds
+the longest path, in LUT levels, ending at the registers, memories and other
+primitives clocked by each clock as well as at the outputs of the module. The
+delay of a path is estimated by multiplying its levels by an average delay per
+level, which includes routing. Carry chains and the wide function multiplexers
+placed next to LUTs are followed, but do not count as a level.
+
+The result is written as JSON and a threshold on the number of levels can be
+given, in which case the script exits with an error if it is exceeded. This
+gives an indication of whether a change made timing worse in seconds, rather
+than after a full place and route.
+"""
+
+import argparse
+import json
+import re
+import sys
+
+# Cells which count as a level of logic, across generic cells and the cells of
+# the supported FPGA families.
+_level_re = re.compile(r'^(\$lut|\$_LUT.*|LUT\d|SB_LUT4|TRELLIS_COMB'
+        r'|\$_(AND|OR|XOR|XNOR|NAND|NOR|NOT|ANDNOT|ORNOT|MUX|NMUX|AOI\d|OAI\d)_'
+        r'|\$(and|or|xor|xnor|not|neg|add|sub|mul|shl|shr|sshl|sshr|shift|shiftx'
+        r'|eq|ne|lt|le|gt|ge|logic_and|logic_or|logic_not|reduce_\w+|mux|pmux|bmux'
+        r'|demux|alu|lcu))$')
+
+# Cells which are followed but do not count as a level, such as dedicated
+# carry logic.
+_transparent_re = re.compile(r'^(CCU2C|CCU2D|SB_CARRY|PFUMX|L6MUX21|\$_BUF_|\$pos)$')
+
+# Ports which clock a register or memory. Any other cell is considered to be
+# the start and end of a path.
+_clock_ports = ('CLK', 'C', 'CLKA', 'CLKB', 'CLKR', 'CLKW', 'RCLK', 'WCLK',
+        'RCLKN', 'WCLKN')
+
+_unclocked = '(unclocked)'
+_outputs = '(outputs)'
+
+
+def _attribute_set(attributes, name):
+    value = attributes.get(name, 0)
+    if isinstance(value, str):
+        try:
+            return int(value, 2) != 0
+        except ValueError:
+            return True
+    return bool(value)
+
+
+def _net_names(module):
+    """Map each bit to the name of the net it belongs to, preferring names
+    given by the user over those generated by Yosys.
+    """
+    names = {}
+    for name, net in sorted(module.get('netnames', {}).items(),
+            key = lambda n: (n[0].startswith('$'), n[1].get('hide_name', 0), len(n[0]))):
+        bits = net.get('bits', [])
+        for i, bit in enumerate(bits):
+            if isinstance(bit, int) and bit not in names:
+                names[bit] = name if len(bits) == 1 else '%s[%d]' % (name, i)
+    return names
+
+
+def analyze_module(module):
+    cells = module.get('cells', {})
+
+    # Determine the combinational cell driving each bit, along with the input
+    # bits of that cell.
+    drivers = {}
+    for name, cell in cells.items():
+        kind = cell['type']
+        if _level_re.match(kind):
+            levels = 1
+        elif _transparent_re.match(kind):
+            levels = 0
+        else:
+            continue
+
+        directions = cell.get('port_directions', {})
+        connections = cell.get('connections', {})
+        inputs = [
+            bit
+            for port, bits in connections.items()
+            if directions.get(port) == 'input'
+            for bit in bits
+            if isinstance(bit, int)
+        ]
+        for port, bits in connections.items():
+            if directions.get(port) == 'output':
+                for bit in bits:
+                    if isinstance(bit, int):
+                        drivers[bit] = (name, levels, inputs)
+
+    # Determine the depth of each bit, iteratively as carry chains can easily
+    # exceed the recursion limit. A bit which is part of a combinational loop
+    # is considered to start a path.
+    depth = {}
+
+    def depth_of(bit):
+        if bit in depth:
+            return depth[bit][0]
+
+        stack = [bit]
+        visiting = set()
+        while stack:
+            b = stack[-1]
+            if b in depth:
+                stack.pop()
+                continue
+            if b not in drivers:
+                depth[b] = (0, None)
+                stack.pop()
+                continue
+
+            _, levels, inputs = drivers[b]
+            pending = [i for i in inputs if i not in depth and i not in visiting]
+            if pending and b not in visiting:
+                visiting.add(b)
+                stack.extend(pending)
+                continue
+
+            visiting.discard(b)
+            stack.pop()
+            worst = max(inputs, key = lambda i: depth.get(i, (0, None))[0], default = None)
+            depth[b] = (levels + (depth.get(worst, (0, None))[0] if worst is not None else 0),
+                    worst)
+
+        return depth[bit][0]
+
+    def path_to(bit):
+        path = []
+        while bit is not None and bit in drivers:
+            name = drivers[bit][0]
+            path.append({
+                'cell': name,
+                'type': cells[name]['type'],
+                'src': cells[name].get('attributes', {}).get('src', ''),
+            })
+            bit = depth[bit][1]
+        return list(reversed(path))
+
+    names = _net_names(module)
+    endpoints = {}
+
+    def endpoint(clock, name, bits):
+        for bit in bits:
+            if not isinstance(bit, int):
+                continue
+            levels = depth_of(bit)
+            worst = endpoints.get(clock)
+            if worst is None or levels > worst['levels']:
+                endpoints[clock] = {
+                    'levels': levels,
+                    'endpoint': name,
+                    'path': path_to(bit),
+                }
+
+    # Paths ending at registers, memories and other primitives.
+    for name, cell in sorted(cells.items()):
+        kind = cell['type']
+        if _level_re.match(kind) or _transparent_re.match(kind):
+            continue
+
+        directions = cell.get('port_directions', {})
+        connections = cell.get('connections', {})
+
+        clock = _unclocked
+        for port in _clock_ports:
+            bits = [b for b in connections.get(port, []) if isinstance(b, int)]
+            if directions.get(port) == 'input' and bits:
+                clock = names.get(bits[0], str(bits[0]))
+                break
+
+        endpoint(clock, name, [
+            bit
+            for port, bits in connections.items()
+            if directions.get(port) == 'input' and port not in _clock_ports
+            for bit in bits
+        ])
+
+    # Paths ending at the outputs of the module.
+    for name, port in sorted(module.get('ports', {}).items()):
+        if port.get('direction') in ('output', 'inout'):
+            endpoint(_outputs, name, port.get('bits', []))
+
+    return endpoints
+
+
+def analyze(netlist, level_delay):
+    modules = {}
+    for name, module in netlist.get('modules', {}).items():
+        if _attribute_set(module.get('attributes', {}), 'blackbox'):
+            continue
+
+        clocks = analyze_module(module)
+        for clock in clocks.values():
+            clock['estimated_ns'] = round(clock['levels'] * level_delay, 3)
+
+        levels = max((c['levels'] for c in clocks.values()), default = 0)
+        modules[name] = {
+            'levels': levels,
+            'estimated_ns': round(levels * level_delay, 3),
+            'clocks': clocks,
+        }
+
+    return modules
+
+
+def _parse_threshold(s):
+    clock, _, value = s.rpartition('=')
+    try:
+        return clock, int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid threshold: %s' % s)
+
+
+def check(modules, thresholds):
+    """Check the number of levels of each clock against the given thresholds.
+    A threshold without a clock applies to every clock, one with a clock to
+    those whose name contains it.
+    """
+    violations = []
+    for module_name, module in sorted(modules.items()):
+        for clock_name, clock in sorted(module['clocks'].items()):
+            for match, limit in thresholds:
+                if match in clock_name and clock['levels'] > limit:
+                    violations.append(
+                        '%s: %d levels ending at %s (clock %s), exceeding %d' % (
+                            module_name,
+                            clock['levels'],
+                            clock['endpoint'],
+                            clock_name,
+                            limit))
+    return violations
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description = 'Estimate the logic depth of a synthesized design')
+
+    parser.add_argument('--level-delay', metavar = 'NS', type = float, default = 1.0,
+            help = 'estimated delay of a level of logic, including routing')
+    parser.add_argument('--max-levels', metavar = '[CLOCK=]N', type = _parse_threshold,
+            action = 'append', default = [],
+            help = 'fail if a path, optionally ending at a clock containing CLOCK, '
+                'exceeds N levels, may be repeated')
+    parser.add_argument('--json', metavar = 'PATH', required = True,
+            help = 'path of the estimate')
+    parser.add_argument('netlist', metavar = 'NETLIST',
+            type = argparse.FileType('r'),
+            help = 'Yosys JSON netlist')
+
+    args = parser.parse_args(args[1:])
+
+    modules = analyze(json.load(args.netlist), args.level_delay)
+    violations = check(modules, args.max_levels)
+
+    with open(args.json, 'w') as f:
+        json.dump({
+            'level_delay_ns': args.level_delay,
+            'modules': modules,
+            'violations': violations,
+        }, f, indent = 4, sort_keys = True)
+
+    for violation in violations:
+        print(violation, file = sys.stderr)
+
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))